@@ -0,0 +1,100 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+"""
+Library index benchmark with a synthetic MPD database.
+
+Builds the index from listallinfo-like entries, saves and loads it, and
+times the library navigation queries. Prints one JSON object per step:
+
+    python benchmarks/library_benchmark.py [--songs 100000]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from library_index import LibraryIndex
+from scheduler import monotonic
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root).strip()
+    except Exception:
+        return ""
+
+""" listallinfo entries: directories and songs, about 12 songs per album and 8 albums per artist """
+def entries(songs):
+    rng = random.Random(1)
+    genres = ["Genre %d" % i for i in range(40)]
+    for song in range(songs):
+        album = song//12
+        artist = album//8
+        if song % 12 == 0:
+            yield {"directory": "Artist %d/Album %d" % (artist, album)}
+        entry = {
+            "file"   : "Artist %d/Album %d/%02d Track.flac" % (artist, album, song % 12 + 1),
+            "artist" : "Artist %d" % artist,
+            "album"  : "Album %d" % album,
+            "title"  : "Title %d" % song,
+            "track"  : str(song % 12 + 1),
+            "time"   : "240",
+            "genre"  : genres[artist % len(genres)],
+        }
+        # Some songs carry several genres
+        if rng.random() < 0.05:
+            entry["genre"] = [entry["genre"], rng.choice(genres)]
+        yield entry
+
+def timed(function, repeat=1):
+    start = monotonic()
+    for i in range(repeat):
+        result = function()
+    return result, (monotonic() - start)/repeat
+
+def main():
+    parser = argparse.ArgumentParser(description="Library index benchmark")
+    parser.add_argument("--songs", type=int, default=100000, help="songs in the synthetic database")
+    args = parser.parse_args()
+
+    results = []
+    def report(step, seconds, **extra):
+        result = {"step": step, "songs": args.songs, "ms": round(1000*seconds, 3), "revision": git_revision()}
+        result.update(extra)
+        print(json.dumps(result, sort_keys=True))
+        sys.stdout.flush()
+
+    data = list(entries(args.songs))
+    index, seconds = timed(lambda: LibraryIndex.build(data, "1"))
+    report("build", seconds)
+
+    filename = os.path.join(tempfile.mkdtemp(prefix="pitft-bench-"), "mpd-library.idx")
+    _, seconds = timed(lambda: index.save(filename))
+    report("save", seconds, bytes=os.path.getsize(filename))
+
+    loaded, seconds = timed(lambda: LibraryIndex.load(filename))
+    report("load", seconds)
+    assert loaded.list("artist", "genre", "Genre 3") == index.list("artist", "genre", "Genre 3")
+
+    # Navigation: genre -> artist -> album -> title, first without cached results
+    genre = loaded.list("genre")[3]
+    artist = loaded.list("artist", "genre", genre)[0]
+    album = loaded.list("album", "artist", artist)[0]
+    queries = [("genres", ("genre",)),
+               ("artists_of_genre", ("artist", "genre", genre)),
+               ("albums_of_artist", ("album", "artist", artist)),
+               ("titles_of_album", ("title", "album", album))]
+    for name, query in queries:
+        loaded.results.clear()
+        result, seconds = timed(lambda: loaded.list(*query))
+        report(name, seconds, items=len(result))
+        _, seconds = timed(lambda: loaded.list(*query), 1000)
+        report(name + "_cached", seconds, items=len(result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/python2
+# -*- coding: utf-8 -*-
+"""
+Headless rendering benchmark for ScreenManager.
+
+Runs pygame with the SDL dummy video driver against a fake player control
+with synthetic data and prints one JSON object per case and resolution:
+
+    python benchmarks/render_benchmark.py [--resolution 480x320] [--frames 300]
+                                          [--list-sizes 100,10000,100000]
+
+Without --resolution both supported resolutions are run, each in its own
+process because positioning computes the layout at import time. Cover
+changes wait for the cover decode thread, and their result has the decode
+times too.
+"""
+import os
+import sys
+import imp
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+RESOLUTIONS = ["480x320", "320x240"]
+
+def load_config(resolution):
+    config = imp.new_module("config")
+    configfile = os.path.join(root, "config.py")
+    if not os.path.isfile(configfile):
+        configfile = os.path.join(root, "config.py.in")
+    exec(compile(open(configfile).read(), configfile, "exec"), config.__dict__)
+
+    config.resolution = resolution
+    config.logpath = tempfile.mkdtemp(prefix="pitft-bench-")
+    config.lircrcfile = ""
+    # Fall back to the pygame default font
+    if not os.path.isfile(os.path.join(root, config.fontfile)):
+        config.fontfile = None
+    sys.modules["config"] = config
+    return config
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root).strip()
+    except Exception:
+        return ""
+
+def run(resolution, frames, list_sizes):
+    import pygame
+    config = load_config(resolution)
+
+    from player_base import PlayerBase
+    from stats import RollingHistogram
+    from scheduler import monotonic
+
+    pygame.init()
+    # 16 bit like the PiTFT framebuffer; the dummy driver defaults to 8 bit
+    screen = pygame.display.set_mode(config.resolution, 0, 16)
+
+    long_title = u"Symphonie fantastique, Op. 14: V. Songe d'une nuit du sabbat – Larghetto – Allegro – Dies irae – Ronde du sabbat ÅÄÖ ÆØ 交響曲"
+
+    class BenchPlayer(PlayerBase):
+        def __init__(self):
+            super(BenchPlayer, self).__init__("bench", config)
+            for capability in ["volume_enabled", "seek_enabled", "random_enabled", "repeat_enabled", "elapsed_enabled"]:
+                self.capabilities[capability] = True
+            self.data["status"].update(state="play", elapsed="0", volume="60", random="1", repeat="0")
+            self.data["song"].update(artist=u"Hector Berlioz – Orchestre Révolutionnaire et Romantique".encode("utf-8"),
+                                     album=u"Symphonie fantastique, Op. 14 (Live at the Salle Pleyel)".encode("utf-8"),
+                                     date="1830", track="5", title=long_title.encode("utf-8"), time="600", pos="0")
+            self.data["menu"].append({"name": "PLAYLIST", "type": "listview", "listcontent": self.get_playlist})
+            self.playlist_length = list_sizes[0]
+
+        def get_playlist(self):
+            content = [(u"%s. Artist %d – %s" % (str(i+1).rjust(4), i % 97, long_title[:20 + i % 60])).encode("utf-8")
+                       for i in range(self.playlist_length)]
+            self.data["list"]["type"]        = "playlist"
+            self.data["list"]["content"]     = content
+            self.data["list"]["viewcontent"] = content
+            self.data["list"]["highlight"]   = 100
+            self.data["list"]["position"]    = 100
+            self.data["list"]["click"]       = lambda item=-1, button=1: "listview"
+            self.data["list"]["buttons"]     = []
+
+        # Publish like the poller thread and collect like the UI thread
+        def push(self):
+            self.publish()
+            self.collect()
+
+    class BenchPlayerControl(object):
+        def __init__(self):
+            self.players = [BenchPlayer()]
+            self.current = 0
+        def __getitem__(self, item):
+            return self.players[self.current][item]
+        def __call__(self, item):
+            return self.players[self.current](item)
+        def get_players(self):
+            return self.players
+        def get_current(self):
+            return self.current
+        def updated(self, item="all"):
+            return self.players[self.current].updated(item)
+        def update_ack(self, item):
+            self.players[self.current].update_ack(item)
+        def set_list_offset(self, offset):
+            self.players[self.current].set_list_offset(offset)
+        def control_player(self, command, parameter=-1, id=-1):
+            pass
+        def switch_active_player(self, id):
+            pass
+        def refresh(self):
+            return True, self.updated()
+        def fileno(self):
+            return None
+        def wakeup(self):
+            pass
+
+    from screen_manager import ScreenManager
+    pc = BenchPlayerControl()
+    player = pc.players[0]
+    sm = ScreenManager(root + "/", pc)
+    player.push()
+    sm.refresh()
+    sm.render(screen)
+
+    # Two large cover images to switch between
+    covers = []
+    for index, color in enumerate([(200, 40, 40), (40, 40, 200)]):
+        image = pygame.Surface((1200, 1200))
+        image.fill(color)
+        pygame.draw.circle(image, (240, 240, 240), (600, 600), 400)
+        filename = os.path.join(config.logpath, "cover%d.png" % index)
+        pygame.image.save(image, filename)
+        covers.append(filename)
+
+    def frame_elapsed(i):
+        player.data["status"]["elapsed"] = "%.3f" % (i*0.25)
+        player.data["update"]["elapsed"] = True
+        player.push()
+        sm.refresh()
+
+    def frame_full(i):
+        sm.force_update()
+
+    def frame_trackinfo(i):
+        player.data["song"] = dict(player.data["song"], title=(long_title + u" %d" % i).encode("utf-8"))
+        player.data["update"]["trackinfo"] = True
+        player.push()
+        sm.refresh()
+
+    def frame_coverart(i):
+        player.data["coverartfile"] = covers[i % 2]
+        player.data["cover"] = True
+        player.data["update"]["coverart"] = True
+        player.push()
+        sm.refresh()
+        # Decoded on the cover decode thread: wait for it to be shown
+        deadline = monotonic() + 5.0
+        while not sm.coverart_decoded() and monotonic() < deadline:
+            time.sleep(0.0005)
+        sm.refresh()
+
+    def open_list(length):
+        def prepare():
+            player.playlist_length = length
+            player.get_playlist()
+            player.push()
+            sm.switch_view("listview")
+        return prepare
+
+    def frame_list(i):
+        sm.force_update("screen")
+
+    drag = {"direction": -12}
+    def frame_drag(i):
+        # Drag down and up again, ending the scroll every 40 steps
+        if i % 40 == 0:
+            drag["direction"] = -drag["direction"]
+        sm.scroll((200, 150), (0, drag["direction"]), i % 40 == 39)
+
+    cases = [
+        ("mainscreen_full",      None,      frame_full),
+        ("mainscreen_elapsed",   None,      frame_elapsed),
+        ("mainscreen_trackinfo", None,      frame_trackinfo),
+        ("coverart_change",      None,      frame_coverart),
+    ]
+    for length in list_sizes:
+        cases.append(("listview_render", open_list(length), frame_list))
+        cases.append(("listview_drag",   open_list(length), frame_drag))
+
+    results = []
+    for name, prepare, step in cases:
+        sm.switch_view("main")
+        if prepare:
+            prepare()
+        sm.render(screen)
+
+        histogram = RollingHistogram(frames)
+        start = monotonic()
+        for i in range(frames):
+            frame_start = monotonic()
+            step(i)
+            rects = sm.render(screen)
+            if rects:
+                pygame.display.update(rects)
+            histogram.add(monotonic() - frame_start)
+        total = monotonic() - start
+
+        summary = histogram.summary()
+        results.append({
+            "case"       : name,
+            "resolution" : "%dx%d" % config.resolution,
+            "revision"   : git_revision(),
+            "items"      : player.playlist_length if prepare else None,
+            "frames"     : frames,
+            "fps"        : round(frames/total, 1),
+            "mean_ms"    : round(1000*total/frames, 3),
+            "p50_ms"     : round(1000*summary["p50"], 3),
+            "p95_ms"     : round(1000*summary["p95"], 3),
+            "max_ms"     : round(1000*summary["max"], 3),
+        })
+        if name == "coverart_change":
+            results[-1]["decode"] = sm.decode_stats()
+    pygame.quit()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless ScreenManager rendering benchmark")
+    parser.add_argument("--resolution", choices=RESOLUTIONS, help="run only this resolution")
+    parser.add_argument("--frames", type=int, default=300, help="frames per case")
+    parser.add_argument("--list-sizes", default="100,10000,100000", help="comma separated list view lengths")
+    args = parser.parse_args()
+
+    if args.resolution:
+        resolution = tuple(int(value) for value in args.resolution.split("x"))
+        list_sizes = [int(value) for value in args.list_sizes.split(",")]
+        for result in run(resolution, args.frames, list_sizes):
+            print(json.dumps(result, sort_keys=True))
+            sys.stdout.flush()
+    else:
+        for resolution in RESOLUTIONS:
+            subprocess.check_call([sys.executable, os.path.abspath(__file__),
+                                   "--resolution", resolution, "--frames", str(args.frames),
+                                   "--list-sizes", args.list_sizes])
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
-import subprocess
-from threading import Thread
+import functools
 import time
 import DiscID
 import CDDB
 import pylast
 
 from player_base import PlayerBase
+from cover_cache import cover_key
+from downloader import downloader
 
 class CDControl (PlayerBase):
     def __init__(self, config):
@@ -94,6 +95,8 @@ class CDControl (PlayerBase):
         self.cdinfo = {}
         self.data["cover"] = False
         self.data["coverartfile"] = ""
+        self.data["coverkey"] = ""
+        self.coverart_pending = ""
 
     def load_cd(self):
         self.cd_inserted = True
@@ -197,25 +200,13 @@ class CDControl (PlayerBase):
         # Fetch coverart
         if not self.data["cover"]:
             self.logger.debug("CD coverart changed, fetching...")
-
-            # Find cover art on different thread
-            try:
-                if self.coverartThread:
-                    if not self.coverartThread.is_alive():
-                        self.coverartThread = Thread(target=self._fetch_coverart(disc["artist"], disc["album"]))
-                        self.coverartThread.start()
-                else:
-                    self.coverartThread = Thread(target=self._fetch_coverart(disc["artist"], disc["album"]))
-                    self.coverartThread.start()
-            except Exception as e:
-                self.logger.error("Coverartthread: %s" % e)
+            key = cover_key(disc["artist"], disc["album"])
+            self.request_coverart(key, functools.partial(self._fetch_coverart, disc["artist"], disc["album"], key))
 
         return disc
 
-    def _fetch_coverart(self, artist, album):
-        self.data["cover"] = False
-        self.data["coverartfile"]= ""
-
+    """ Cover worker thread. Return value: downloaded cover art file, "" if none found """
+    def _fetch_coverart(self, artist, album, key):
         # Try to fetch from LastFM
         if self.lfm_connected:
             try:
@@ -230,14 +221,14 @@ class CDControl (PlayerBase):
                 try:
                     coverart_url = lastfm_album.get_cover_image(2)
                     if coverart_url:
-                        self.data["coverartfile"] = self.config.logpath + "/cd_cover.png"
-                        subprocess.check_output("wget -q %s -O %s" % (coverart_url, self.data["coverartfile"]), shell=True )
+                        coverartfile = self.coverart_download_file(key)
+                        downloader.get(coverart_url, coverartfile)
                         self.logger.debug("CD coverart downloaded from Last.fm")
-                        self.data["cover"] = True
-                        self.data["update"]["coverart"] = True
+                        return coverartfile
                 except Exception as e:
                     self.logger.error(e)
                     pass
+        return ""
 
     def control(self, command, parameter=-1):
         pass
@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
 import logging
+import os
+import errno
+import fcntl
+import select
+from threading import Thread, Event
 import config
+from scheduler import monotonic
 if config.spotify_host and config.spotify_port:
     from spotify_control import SpotifyControl
 if config.mpd_host and config.mpd_port:
@@ -8,6 +14,54 @@ if config.mpd_host and config.mpd_port:
 if config.cdda_enabled:
     from cd_control import CDControl
 
+class PlayerPoller(Thread):
+    """
+    Refreshes one player on its own thread, so a slow backend can't stall
+    the UI. Each pass runs the commands queued by the UI, refreshes and
+    publishes a snapshot, and wakes the UI if it changed.
+    """
+    def __init__(self, player, interval, is_active, wakeup):
+        super(PlayerPoller, self).__init__(name="poller-" + player("name"))
+        self.daemon    = True
+        self.logger    = logging.getLogger("PiTFT-Playerui.poller." + player("name"))
+        self.player    = player
+        self.interval  = interval
+        self.is_active = is_active
+        self.wakeup    = wakeup
+        self.stopped   = Event()
+
+    def run(self):
+        # Force first refresh with song info for all players
+        first = True
+        while not self.stopped.is_set():
+            start = monotonic()
+            try:
+                with self.player.lock:
+                    self.player.run_commands()
+                    self.player.refresh(self.is_active() or first)
+                first = False
+                if self.player.publish():
+                    self.wakeup()
+            except Exception as e:
+                self.logger.error(e)
+
+            # Sleep until the next poll, the player has news or the UI queued a command
+            timeout = max(self.interval - (monotonic() - start), 0.0)
+            fds = [self.player.wake_read]
+            fd = self.player.fileno()
+            if fd is not None:
+                fds.append(fd)
+            try:
+                select.select(fds, [], [], timeout)
+            except Exception as e:
+                self.logger.debug(e)
+                self.stopped.wait(timeout)
+            self.player.clear_wake()
+
+    def stop(self):
+        self.stopped.set()
+        self.player.wake()
+
 class PlayerControl:
     def __init__(self):
         self.logger  = logging.getLogger("PiTFT-Playerui.player_control")
@@ -39,8 +93,39 @@ class PlayerControl:
             self.logger.error("No players defined! Quitting")
             raise
 
-        # Force first refresh for all players
-        self.do_first_refresh = True
+        # Pollers wake the UI thread through a pipe
+        self.wake_read, self.wake_write = os.pipe()
+        for fd in (self.wake_read, self.wake_write):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        # Poll every player on its own thread. Seconds
+        self.refreshtime = 0.2
+        self.pollers = []
+        for id, player in enumerate(self.players):
+            poller = PlayerPoller(player, self.refreshtime, self._is_current(id), self.wakeup)
+            self.pollers.append(poller)
+            poller.start()
+
+    def _is_current(self, id):
+        return lambda: self.current == id
+
+    """ Called from poller threads when a new snapshot is available """
+    def wakeup(self):
+        try:
+            os.write(self.wake_write, b"x")
+        except OSError as e:
+            # Pipe full: the UI has a wakeup pending anyway
+            if e.errno != errno.EAGAIN:
+                raise
+
+    """ Readable when players have published new data """
+    def fileno(self):
+        return self.wake_read
+
+    def stop(self):
+        for poller in self.pollers:
+            poller.stop()
 
     def __getitem__(self, item):
         if self.players[self.current]:
@@ -74,16 +159,19 @@ class PlayerControl:
                         self.logger.debug("pausing %s" % player("name"))
                         self.control_player("pause", 0, id)
 
+    """ Take the latest player snapshots into use. Doesn't block """
     def refresh(self):
         active = False
-        # Update all for active, only status for rest
-        for id, player in enumerate(self.players):
-            try:
-                player.refresh(self.current == id or self.do_first_refresh)
-                self.do_first_refresh = False
-            except Exception as e:
+        try:
+            while os.read(self.wake_read, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
                 self.logger.error(e)
 
+        for player in self.players:
+            player.collect()
+
         # Get active player
         self.determine_active_player()
 
@@ -91,7 +179,7 @@ class PlayerControl:
         if self.players[self.current]["status"]["state"] == "play":
             active = True
         return active, self.updated()
-        
+
     def updated(self, item="all"):
         if item == "all":
             return True in self.players[self.current]["update"].values()
@@ -101,6 +189,9 @@ class PlayerControl:
     def update_ack(self, item):
         self.players[self.current].update_ack(item)
 
+    def set_list_offset(self, offset):
+        self.players[self.current].set_list_offset(offset)
+
     def control_player(self, command, parameter=-1, id=-1):
         # Translate
         if self.players[self.current]["status"]:
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import os
+import logging
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+import pygame
+
+import config
+from positioning import size
+
+""" Cache key of cover art, from e.g. artist and album or a Spotify cover_uri """
+def cover_key(*parts):
+    text = "\0".join(part.encode("utf-8") if isinstance(part, unicode) else str(part) for part in parts)
+    return hashlib.md5(text).hexdigest()
+
+class CoverCache(object):
+    """
+    Cover art already scaled to the size shown, kept on disk as raw RGB
+    pixels in files named by the cover key. A cached cover loads with one
+    sequential read and no decoding or scaling. The least recently used
+    files are removed when the total goes over max_bytes. Thread safe.
+    """
+    def __init__(self, path, image_size, max_bytes):
+        self.logger     = logging.getLogger("PiTFT-Playerui.cover_cache")
+        self.image_size = tuple(image_size)
+        # Covers of another size are in their own folder
+        self.path       = os.path.join(path, "%dx%d" % self.image_size)
+        self.file_bytes = self.image_size[0]*self.image_size[1]*3
+        self.max_bytes  = max_bytes
+        self.files      = OrderedDict() # Key: bytes, least recently used first
+        self.total      = 0
+        self.hits       = 0
+        self.misses     = 0
+        self.lock       = Lock()
+
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            # Oldest first, as the files are touched when used
+            names = [name for name in os.listdir(self.path) if name.endswith(".rgb")]
+            names.sort(key=lambda name: os.path.getmtime(os.path.join(self.path, name)))
+            for name in names:
+                self.files[name[:-4]] = os.path.getsize(os.path.join(self.path, name))
+            self.total = sum(self.files.values())
+        except Exception as e:
+            self.logger.error(e)
+
+    def filename(self, key):
+        return os.path.join(self.path, key + ".rgb")
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.files
+
+    """ Return value: cached cover as a surface, or None """
+    def get(self, key):
+        if not key:
+            return None
+        filename = self.filename(key)
+        with self.lock:
+            if key not in self.files:
+                self.misses += 1
+                return None
+            self.files[key] = self.files.pop(key)
+
+        try:
+            with open(filename, "rb") as f:
+                pixels = f.read()
+            if len(pixels) != self.file_bytes:
+                raise ValueError("%s: %d bytes, expected %d" % (filename, len(pixels), self.file_bytes))
+            os.utime(filename, None)
+            self.hits += 1
+            return pygame.image.fromstring(pixels, self.image_size, "RGB")
+        except Exception as e:
+            self.logger.error(e)
+            self.remove(key)
+            self.misses += 1
+            return None
+
+    """ Store a cover, scaling it if needed. Return value: the stored surface """
+    def put(self, key, image):
+        if image.get_size() != self.image_size:
+            image = pygame.transform.scale(image, self.image_size)
+        if not key:
+            return image
+
+        filename = self.filename(key)
+        tmpfile = "%s.%d.tmp" % (filename, id(image))
+        try:
+            with open(tmpfile, "wb") as f:
+                f.write(pygame.image.tostring(image, "RGB"))
+            os.rename(tmpfile, filename)
+        except Exception as e:
+            self.logger.error(e)
+            return image
+
+        with self.lock:
+            self.total -= self.files.pop(key, 0)
+            self.files[key] = self.file_bytes
+            self.total += self.file_bytes
+            evicted = []
+            while len(self.files) > 1 and self.total > self.max_bytes:
+                oldest, bytes = self.files.popitem(last=False)
+                self.total -= bytes
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(self.filename(oldest))
+            except OSError as e:
+                self.logger.debug(e)
+        return image
+
+    """ Load an image file, scale and store it. Return value: the stored surface """
+    def load(self, key, filename):
+        return self.put(key, pygame.image.load(filename))
+
+    def remove(self, key):
+        with self.lock:
+            self.total -= self.files.pop(key, 0)
+        try:
+            os.remove(self.filename(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        return "%d covers, %d bytes, %d hits, %d misses" % (len(self.files), self.total, self.hits, self.misses)
+
+# Shared by the players and the screen manager
+cover_cache = CoverCache(config.logpath + "/covers", size["coverart"],
+                         getattr(config, "cover_cache_size", 16)*1024*1024)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import deque
+from threading import Thread, Condition
+
+import config
+
+class CoverJob(object):
+    def __init__(self, key, fetch):
+        self.key     = key
+        self.fetch   = fetch
+        self.waiters = {}    # Owner: done callback
+        self.running = False
+
+    """ True when no owner wants the result any more """
+    @property
+    def cancelled(self):
+        return not self.waiters
+
+class CoverFetcher(object):
+    """
+    Worker threads fetching cover art for the players, so searching and
+    downloading never run on a poller or the UI thread.
+
+    Jobs are identified by cover key. A request for a key already queued or
+    running joins that job instead of starting another one. Each owner has
+    at most one job it waits for: a new request cancels the previous one,
+    and jobs nobody waits for any more are dropped from the queue. The
+    result is passed to done(key, result) of every owner still waiting, on
+    the worker thread.
+    """
+    def __init__(self, workers=2, name="cover"):
+        self.logger    = logging.getLogger("PiTFT-Playerui.cover_fetcher")
+        self.workers   = workers
+        self.name      = name
+        self.threads   = []
+        self.queue     = deque()
+        self.jobs      = {}  # Key: job queued or running
+        self.owners    = {}  # Owner: job it waits for
+        self.condition = Condition()
+        self.fetched   = 0
+        self.joined    = 0
+        self.dropped   = 0
+
+    """ Fetch cover key with fetch() and call done(key, result) for owner """
+    def submit(self, owner, key, fetch, done):
+        with self.condition:
+            # Asked again while still waiting
+            if owner in self.owners and self.owners[owner].key == key:
+                return self.owners[owner]
+
+            self._cancel(owner)
+            job = self.jobs.get(key)
+            if job:
+                self.joined += 1
+            else:
+                job = self.jobs[key] = CoverJob(key, fetch)
+                self.queue.append(job)
+                self._start_worker()
+                self.condition.notify()
+            job.waiters[owner] = done
+            self.owners[owner] = job
+            return job
+
+    """ Stop waiting for the job of owner """
+    def cancel(self, owner):
+        with self.condition:
+            self._cancel(owner)
+
+    def _cancel(self, owner):
+        job = self.owners.pop(owner, None)
+        if job:
+            job.waiters.pop(owner, None)
+            if job.cancelled and not job.running:
+                self.queue.remove(job)
+                del self.jobs[job.key]
+                self.dropped += 1
+
+    def _start_worker(self):
+        # One more thread if there are more jobs than threads, up to the limit
+        if len(self.threads) < self.workers and len(self.jobs) > len(self.threads):
+            thread = Thread(target=self._work, name="%s-%d" % (self.name, len(self.threads)))
+            thread.daemon = True
+            self.threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                job = self.queue.popleft()
+                job.running = True
+
+            try:
+                result = job.fetch()
+            except Exception as e:
+                self.logger.error(e)
+                result = None
+
+            with self.condition:
+                del self.jobs[job.key]
+                self.fetched += 1
+                waiters = job.waiters.items()
+                for owner, done in waiters:
+                    if self.owners.get(owner) is job:
+                        del self.owners[owner]
+
+            for owner, done in waiters:
+                try:
+                    done(job.key, result)
+                except Exception as e:
+                    self.logger.error(e)
+
+    def stats(self):
+        return "%d fetched, %d joined, %d dropped, %d queued" % (self.fetched, self.joined, self.dropped, len(self.queue))
+
+# Shared by the players
+cover_fetcher = CoverFetcher(getattr(config, "cover_workers", 2))
+
+# Decoding for the screen, on a thread of its own so it never waits behind downloads
+cover_decoder = CoverFetcher(1, "decode")
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import logging
+import httplib
+import urlparse
+from threading import Lock
+
+import config
+from scheduler import monotonic
+from stats import RollingHistogram
+
+class DownloadError(Exception):
+    pass
+
+class Downloader(object):
+    """
+    HTTP(S) downloads to files, without forking a downloader. Idle keep-alive
+    connections are kept per host and reused; a broken reused socket is
+    reopened and the request sent again once. The body is streamed to a
+    temporary file that is renamed over the target only when complete, so
+    a reader never sees a partial file. Thread safe.
+    """
+    def __init__(self, connect_timeout=5.0, read_timeout=10.0, max_bytes=4*1024*1024,
+                 max_redirects=3, chunk_size=16*1024):
+        self.logger          = logging.getLogger("PiTFT-Playerui.downloader")
+        self.connect_timeout = connect_timeout
+        self.read_timeout    = read_timeout
+        self.max_bytes       = max_bytes
+        self.max_redirects   = max_redirects
+        self.chunk_size      = chunk_size
+        self.idle            = {}  # (scheme, host, port): idle connections
+        self.lock            = Lock()
+
+        # Counters
+        self.downloads = 0
+        self.failures  = 0
+        self.bytes     = 0
+        self.latency   = RollingHistogram(256)
+
+    """ Download url to filename. Return value: bytes written. Raises DownloadError """
+    def get(self, url, filename):
+        start = monotonic()
+        try:
+            for redirect in range(self.max_redirects + 1):
+                response, release = self._request(url)
+                try:
+                    if response.status in (301, 302, 303, 307, 308):
+                        location = response.getheader("location")
+                        response.read()
+                        if not location:
+                            raise DownloadError("%s: redirect without location" % url)
+                        url = urlparse.urljoin(url, location)
+                        continue
+                    if response.status != 200:
+                        response.read()
+                        raise DownloadError("%s: HTTP %d %s" % (url, response.status, response.reason))
+                    size = self._save(response, filename)
+                finally:
+                    release()
+                break
+            else:
+                raise DownloadError("%s: too many redirects" % url)
+        except (DownloadError, httplib.HTTPException, socket.error, IOError, OSError) as e:
+            with self.lock:
+                self.failures += 1
+            if not isinstance(e, DownloadError):
+                e = DownloadError("%s: %s" % (url, e))
+            raise e
+
+        with self.lock:
+            self.downloads += 1
+            self.bytes += size
+            self.latency.add(monotonic() - start)
+        self.logger.debug("Downloaded %s: %d bytes in %.0f ms" % (url, size, 1000*(monotonic() - start)))
+        return size
+
+    """ Return value: (response, release function giving the connection back) """
+    def _request(self, url):
+        # URLs without a scheme, like host:port/path, are plain HTTP
+        if "://" not in url:
+            url = "http://" + url
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise DownloadError("%s: unsupported scheme" % url)
+        host = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        reused = True
+        connection = self._take(host)
+        while True:
+            if not connection:
+                connection = self._connect(host)
+                reused = False
+            try:
+                connection.request("GET", path, headers={"Connection": "keep-alive"})
+                response = connection.getresponse()
+                break
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                connection = None
+                # Only retry if the server dropped a kept-alive connection
+                if not reused:
+                    raise
+                self.logger.debug("Reconnecting: %s" % e)
+
+        def release():
+            # Reuse only if the response was read to the end
+            if response.will_close or not response.isclosed():
+                connection.close()
+            else:
+                with self.lock:
+                    self.idle.setdefault(host, []).append(connection)
+        return response, release
+
+    def _take(self, host):
+        with self.lock:
+            connections = self.idle.get(host)
+            return connections.pop() if connections else None
+
+    def _connect(self, host):
+        scheme, hostname, port = host
+        if scheme == "https":
+            connection = httplib.HTTPSConnection(hostname, port, timeout=self.connect_timeout)
+        else:
+            connection = httplib.HTTPConnection(hostname, port, timeout=self.connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        return connection
+
+    """ Stream the body to filename through a temporary file. Return value: bytes written """
+    def _save(self, response, filename):
+        length = response.getheader("content-length")
+        if length and int(length) > self.max_bytes:
+            raise DownloadError("%s bytes, more than %d" % (length, self.max_bytes))
+
+        tmpfile = "%s.%d.tmp" % (filename, id(response))
+        size = 0
+        try:
+            with open(tmpfile, "wb") as f:
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise DownloadError("more than %d bytes" % self.max_bytes)
+                    f.write(chunk)
+            if not size:
+                raise DownloadError("empty response")
+            os.rename(tmpfile, filename)
+        except Exception:
+            try:
+                os.remove(tmpfile)
+            except OSError:
+                pass
+            raise
+        return size
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+    def stats(self):
+        latency = self.latency.summary()
+        return "%d downloads, %d failed, %d bytes, p50 %.0f ms, max %.0f ms" % (
+            self.downloads, self.failures, self.bytes, 1000*latency["p50"], 1000*latency["max"])
+
+# Shared by the players
+downloader = Downloader(getattr(config, "download_connect_timeout", 5.0),
+                        getattr(config, "download_read_timeout", 10.0),
+                        getattr(config, "download_max_size", 4)*1024*1024)
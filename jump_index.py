@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_right
+
+""" Jump letter of a list item: first letter or digit, uppercase. "#" for others """
+def jump_letter(item):
+    try:
+        text = item.decode("utf-8") if isinstance(item, str) else item
+    except UnicodeDecodeError:
+        return u"#"
+    for char in text:
+        if char.isalpha():
+            return char.upper()
+        if char.isdigit():
+            return u"#"
+    return u"#"
+
+""" Sort key grouping items by jump letter, "#" first, then case-insensitively """
+def sort_key(item):
+    letter = jump_letter(item)
+    text = item.decode("utf-8", "replace") if isinstance(item, str) else item
+    return (letter != u"#", letter, text.lower(), item)
+
+class JumpIndex(object):
+    """
+    First letter -> index table of a sorted list, for jumping to a letter
+    with the scrollbar. letters[i] is the i:th letter in list order and
+    starts[i] the index of its first item. Lists sorted with sort_key have
+    one run per letter.
+    """
+    def __init__(self, items):
+        self.letters = []
+        self.starts  = []
+        self.counts  = []
+        for index, item in enumerate(items):
+            letter = jump_letter(item)
+            if self.letters and self.letters[-1] == letter:
+                self.counts[-1] += 1
+            else:
+                self.letters.append(letter)
+                self.starts.append(index)
+                self.counts.append(1)
+
+    def __len__(self):
+        return len(self.letters)
+
+    """ Return value: (letter, first index) of the letter slot at fraction 0.0-1.0 of the scrollbar """
+    def at_fraction(self, fraction):
+        slot = min(max(int(fraction*len(self.letters)), 0), len(self.letters) - 1)
+        return self.letters[slot], self.starts[slot]
+
+    """ Return value: letter of the item at index """
+    def letter_at(self, index):
+        slot = max(bisect_right(self.starts, index) - 1, 0)
+        return self.letters[slot]
+
+    """ Return value: scrollbar fraction 0.0-1.0 of index, within the slot of its letter """
+    def fraction_at(self, index):
+        if not self.letters:
+            return 0.0
+        slot = max(bisect_right(self.starts, int(index)) - 1, 0)
+        within = min(max(float(index - self.starts[slot])/self.counts[slot], 0.0), 1.0)
+        return (slot + within)/len(self.letters)
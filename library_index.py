@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+import marshal
+from array import array
+
+from lru_cache import LRUCache
+from jump_index import sort_key
+
+class LibraryIndex(object):
+    """
+    In-memory index of the MPD database for library browsing.
+
+    Tag values are stored once per tag and songs refer to them by number;
+    every value has the list of songs carrying it, all kept in flat arrays
+    that are saved as they are. Listing the values of one tag among the
+    songs with a given value of another costs time in proportion to the
+    matching songs, not to the library.
+    """
+    TAGS = ["genre", "artist", "album", "title"]
+    FILE_VERSION = 2
+
+    def __init__(self, db_update=""):
+        self.db_update = db_update
+        self.songs     = 0
+        self.values    = dict((tag, []) for tag in self.TAGS)        # Tag: value strings
+        self.songvalue = dict((tag, array("i")) for tag in self.TAGS) # Tag: first value number per song, -1 if none
+        self.extra     = dict((tag, {}) for tag in self.TAGS)        # Tag: song: further value numbers
+        self.postings  = dict((tag, array("i")) for tag in self.TAGS) # Tag: song numbers grouped by value
+        self.offsets   = dict((tag, array("i")) for tag in self.TAGS) # Tag: start of each value's songs in postings
+        self.order     = dict((tag, array("i")) for tag in self.TAGS) # Tag: value numbers in sorted order
+        self.numbers   = dict((tag, {}) for tag in self.TAGS)        # Tag: value string: value number
+        self.results   = LRUCache(64)
+
+    """ Build from song dicts as returned by listallinfo; other entries are skipped """
+    @classmethod
+    def build(cls, entries, db_update=""):
+        index = cls(db_update)
+        numbers = index.numbers
+        postings = dict((tag, []) for tag in cls.TAGS)
+        for entry in entries:
+            if "file" not in entry:
+                continue
+            song = index.songs
+            index.songs += 1
+            for tag in cls.TAGS:
+                values = entry.get(tag, "")
+                # Tags with several values come as lists
+                if not isinstance(values, list):
+                    values = [values]
+                first = -1
+                for value in values:
+                    if not value:
+                        continue
+                    number = numbers[tag].get(value)
+                    if number is None:
+                        number = numbers[tag][value] = len(index.values[tag])
+                        index.values[tag].append(value)
+                        postings[tag].append(array("i"))
+                    if first == -1:
+                        first = number
+                    elif number != first:
+                        index.extra[tag].setdefault(song, []).append(number)
+                    postings[tag][number].append(song)
+                index.songvalue[tag].append(first)
+
+        for tag in cls.TAGS:
+            for songs in postings[tag]:
+                index.offsets[tag].append(len(index.postings[tag]))
+                index.postings[tag].extend(songs)
+            index.offsets[tag].append(len(index.postings[tag]))
+            values = index.values[tag]
+            index.order[tag].extend(sorted(range(len(values)), key=lambda number: sort_key(values[number])))
+        return index
+
+    """ Return value: sorted values of tag, among songs with filter as filtertype if given """
+    def list(self, tag, filtertype="", filter=""):
+        key = (tag, filtertype, filter)
+        result = self.results.get(key)
+        if result is not None:
+            return list(result)
+
+        if filtertype and filter:
+            filter_number = self.numbers[filtertype].get(filter)
+            if filter_number is None:
+                return []
+            offsets = self.offsets[filtertype]
+            songs = self.postings[filtertype][offsets[filter_number]:offsets[filter_number+1]]
+            numbers = set(map(self.songvalue[tag].__getitem__, songs))
+            extra = self.extra[tag]
+            if extra:
+                for song in songs:
+                    if song in extra:
+                        numbers.update(extra[song])
+            numbers.discard(-1)
+            result = sorted((self.values[tag][number] for number in numbers), key=sort_key)
+        else:
+            result = [self.values[tag][number] for number in self.order[tag]]
+
+        self.results.put(key, result)
+        return list(result)
+
+    """ Write to filename, replacing it atomically """
+    def save(self, filename):
+        data = (self.FILE_VERSION, self.db_update, self.songs,
+                dict((tag, self.values[tag]) for tag in self.TAGS),
+                dict((tag, self.songvalue[tag].tostring()) for tag in self.TAGS),
+                dict((tag, self.extra[tag]) for tag in self.TAGS),
+                dict((tag, (self.postings[tag].tostring(), self.offsets[tag].tostring(),
+                            self.order[tag].tostring())) for tag in self.TAGS))
+        tmpfile = filename + ".tmp"
+        with open(tmpfile, "wb") as f:
+            f.write(zlib.compress(marshal.dumps(data), 1))
+        os.rename(tmpfile, filename)
+
+    """ Return value: index read from filename, or None if unreadable or from another version """
+    @classmethod
+    def load(cls, filename):
+        try:
+            with open(filename, "rb") as f:
+                data = marshal.loads(zlib.decompress(f.read()))
+            if data[0] != cls.FILE_VERSION:
+                return None
+            file_version, db_update, songs, values, songvalues, extra, arrays = data
+        except Exception:
+            return None
+
+        index = cls(db_update)
+        index.songs = songs
+        for tag in cls.TAGS:
+            index.values[tag] = values[tag]
+            index.extra[tag] = extra[tag]
+            index.numbers[tag] = dict((value, number) for number, value in enumerate(values[tag]))
+            index.songvalue[tag].fromstring(songvalues[tag])
+            index.postings[tag].fromstring(arrays[tag][0])
+            index.offsets[tag].fromstring(arrays[tag][1])
+            index.order[tag].fromstring(arrays[tag][2])
+        return index
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import pygame
+
+class ListBuffer(object):
+    """
+    Tall off-screen surface holding pre-rendered list rows around the
+    visible part of a list. A scroll frame is a single blit from it; rows
+    are rendered only when they enter the buffer.
+    """
+    def __init__(self, width, row_height, rows):
+        self.width      = width
+        self.row_height = row_height
+        self.rows       = rows
+        self.surface    = pygame.Surface((width, rows*row_height), pygame.SRCALPHA, 32)
+        self.first      = 0  # List index of the topmost buffered row
+        self.count      = 0  # Number of rendered rows from first on
+        self.content    = None
+        self.highlight  = None
+        self.length     = 0
+        self.version    = 0
+        self.rendered   = 0  # Rows rendered in total, for statistics
+
+    def invalidate(self):
+        self.content = None
+        self.count = 0
+
+    """
+    Make list rows first..last (inclusive) available in the buffer.
+    render_row(index) returns the text surface of a row.
+    """
+    def fill(self, content, highlight, first, last, render_row):
+        length = len(content)
+        # Lists loaded on demand count their changes in version
+        version = getattr(content, "version", 0)
+        if (content is not self.content or length != self.length or
+                highlight != self.highlight or version != self.version):
+            self.content   = content
+            self.length    = length
+            self.highlight = highlight
+            self.version   = version
+            self.count     = 0
+
+        if self.count and first >= self.first and last < self.first + self.count:
+            return
+
+        # Center the wanted rows, leaving a band above and below them
+        margin = (self.rows - (last - first + 1))//2
+        new_first = max(min(first - margin, length - self.rows), 0)
+        new_count = min(self.rows, length - new_first)
+
+        # Move rows already rendered to their new place
+        keep_first = max(new_first, self.first)
+        keep_end = min(new_first + new_count, self.first + self.count)
+        if self.count and keep_first < keep_end:
+            self.surface.scroll(0, (self.first - new_first)*self.row_height)
+        else:
+            keep_first = keep_end = new_first
+
+        for index in xrange(new_first, new_first + new_count):
+            if keep_first <= index < keep_end:
+                continue
+            y = (index - new_first)*self.row_height
+            self.surface.fill((0,0,0,0), (0, y, self.width, self.row_height))
+            self.surface.blit(render_row(index), (0, y))
+            self.rendered += 1
+
+        self.first = new_first
+        self.count = new_count
+
+    """ Blit rows first..last (inclusive) with row first at position. Return value: rect drawn """
+    def blit(self, surface, position, first, last):
+        area = pygame.Rect(0, (first - self.first)*self.row_height,
+                           self.width, (last - first + 1)*self.row_height)
+        return surface.blit(self.surface, position, area)
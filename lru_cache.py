@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    Least recently used cache limited by entry count and optionally by the
+    total cost of the entries, e.g. bytes. Not thread safe.
+    """
+    def __init__(self, max_entries, max_cost=0, cost=None):
+        self.max_entries = max_entries
+        self.max_cost    = max_cost
+        self.cost        = cost
+        self.entries     = OrderedDict()
+        self.costs       = {}
+        self.total_cost  = 0
+        self.hits        = 0
+        self.misses      = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # Reinsert as the most recently used
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.remove(key)
+        cost = self.cost(value) if self.cost else 0
+        self.entries[key] = value
+        self.costs[key] = cost
+        self.total_cost += cost
+
+        # Evict the least recently used, but keep the newest entry
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or
+                                         (self.max_cost and self.total_cost > self.max_cost)):
+            oldest = next(iter(self.entries))
+            self.remove(oldest)
+
+    def remove(self, key):
+        if key in self.entries:
+            del self.entries[key]
+            self.total_cost -= self.costs.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.costs.clear()
+        self.total_cost = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return "%d entries, cost %d, %d hits, %d misses" % (len(self.entries), self.total_cost, self.hits, self.misses)
@@ -1,14 +1,24 @@
 # -*- coding: utf-8 -*-
-import subprocess
 from threading import Thread
+import functools
 import time
 import os
 import glob
+import select
+import socket
 
-from mpd import MPDClient
+from mpd import MPDClient, ConnectionError as MPDConnectionError
 import pylast
 
-from player_base import PlayerBase
+from player_base import PlayerBase, queued, locked_or_queued, queued_listcontent
+from playlist_window import PlaylistWindow
+from library_index import LibraryIndex
+from lru_cache import LRUCache
+from jump_index import JumpIndex, sort_key
+from scheduler import monotonic
+from cover_cache import cover_cache, cover_key
+from cover_fetcher import cover_fetcher
+from downloader import downloader
 
 class MPDControl (PlayerBase):
     def __init__(self, config):
@@ -35,117 +45,237 @@ class MPDControl (PlayerBase):
         self.noConnection = False
         self.lfm_connected = False
 
+        # Second connection waiting in idle for change notifications
+        self.idle_client = None
+        self.idle_subsystems = ["player", "mixer", "options", "playlist", "database"]
+
+        # Fetch status and song only when idle reports a change
+        self.status_stale = True
+        self.song_stale   = True
+
+        # Elapsed time is counted locally from the last status
+        self.elapsed_base = 0.0
+        self.elapsed_time = 0.0
+
+        # Round trips to the server per operation, for the debug log
+        self.roundtrips = {}
+
+        # Library browsing runs from a local index, rebuilt in the background
+        # when the database changes
+        self.library        = None
+        self.library_file   = config.logpath + "/mpd-library.idx"
+        self.library_stale  = True
+        self.library_thread = None
+
+        # Library views visited, with their scroll positions, by (type, filtertype, filter)
+        self.library_views  = LRUCache(16)
+        self.library_view   = None
+
+        # Cover art of the next songs in the queue is fetched and cached ahead
+        self.prefetch_count = getattr(config, "mpd_prefetch", 1)
+        self.prefetch_next  = None # (next song id, queue version) last looked at
+
+        # Keep the command connection from timing out on the server. Seconds
+        self.ping_interval = 30
+        self.ping_time     = 0.0
+
         self.connect()
         
         if self.client:
             self.logger.info("MPD server version: %s" % self.client.mpd_version)
 
     def refresh(self, active=False):
-        status = {}
-        song = {}
-
         if not self.client:
             self.connect()
 
         else:
             try:
-                status = self.client.status()
-                
-                # Check for changes in status
-                if status != self.data["status"]:
-                    if status["state"] != self.data["status"]["state"]:
-                        self.data["update"]["state"] = True
-                        # Started playing - request active status
-                        if status["state"] == "play":
-                            self.data["update"]["active"] = True
-                    if status["repeat"] != self.data["status"]["repeat"]:
-                        self.data["update"]["repeat"]  = True
-                    if status["random"] != self.data["status"]["random"]:
-                        self.data["update"]["random"]  = True
-                    if status["volume"] != self.data["status"]["volume"]:
-                        self.data["update"]["volume"]  = True
-                    if status["state"] != "stop":
-                        if status["elapsed"] != self.data["status"]["elapsed"]:
-                            self.data["update"]["elapsed"] = True
-                    else:
-                        status["elapsed"] = ""
-
-                    # Save new status
-                    self.data["status"] = status
-
-
-            except Exception as e:
-                self.logger.error(e)
-                self._disconnected()
-
-            try:
-                # Fetch song info
-                if active:
-                    song = self.client.currentsong()
-
-                    # Sanity check
-                    if "pos" not in song:
-                        song["pos"] = ""
-
-                    if "artist" not in song:
-                        song["artist"] = ""
+                changes = self._idle_changes()
 
-                    if "album" not in song:
-                        song["album"] = ""
+                if changes.intersection(["player", "mixer", "options", "playlist"]):
+                    self.status_stale = True
+                if changes.intersection(["player", "playlist"]):
+                    self.song_stale = True
+                if "database" in changes:
+                    self.library_stale = True
 
-                    if "date" not in song:
-                        song["date"] = ""
+                # Fetch status and song info in one round trip if both are needed
+                if self.status_stale and active and self.song_stale:
+                    status, song = self._command_list("refresh", ("status",), ("currentsong",))
+                    self._update_status(status)
+                    self._update_song(song)
 
-                    if "track" not in song:
-                        song["track"] = ""
+                elif self.status_stale:
+                    self._update_status(self._command("refresh", "status"))
 
-                    if "title" not in song:
-                        song["title"] = ""
+                elif active and self.song_stale:
+                    self._update_song(self._command("refresh", "currentsong"))
 
-                    if "time" not in song:
-                        song["time"] = ""
-
-                    # Fetch coverart, but only if we have an album
-                    if song["album"] and (self.data["song"]["album"] != song["album"]):
-                        self.logger.debug("MPD coverart changed, fetching...")
-                        self.data["cover"] = False
-
-                        # Find cover art on different thread
-                        try:
-                            if self.coverartThread:
-                                if not self.coverartThread.is_alive():
-                                    self.coverartThread = Thread(target=self.fetch_coverart(song))
-                                    self.coverartThread.start()
-                            else:
-                                self.coverartThread = Thread(target=self.fetch_coverart(song))
-                                self.coverartThread.start()
-                        except Exception as e:
-                            self.logger.error("Coverartthread: %s" % e)
-
-                    # Check for changes in song
-                    if song != self.data["song"]:
-                        if (
-                                song["pos"]    != self.data["song"]["pos"]    or
-                                song["artist"] != self.data["song"]["artist"] or
-                                song["album"]  != self.data["song"]["album"]  or
-                                song["date"]   != self.data["song"]["date"]   or
-                                song["track"]  != self.data["song"]["track"]  or
-                                song["title"]  != self.data["song"]["title"]  or
-                                song["time"]   != self.data["song"]["time"]
-                        ):
-                            self.data["update"]["trackinfo"] = True
-                        if song["album"] != self.data["song"]["album"]:
-                            self.data["update"]["coverart"] = True
-                        if song["time"] != self.data["song"]["time"]:
-                            self.data["update"]["elapsed"] = True
-
-                        # Save new song info
-                        self.data["song"] = song
+                self._sync_playlist()
+                self._fetch_playlist_pages()
+                if active:
+                    self._prefetch_coverart()
+                self._check_library()
+                self._update_elapsed()
+                self._keepalive()
 
             except Exception as e:
                 self.logger.error(e)
                 self._disconnected()
 
+    """ Readable when the idle connection reports changes """
+    def fileno(self):
+        try:
+            return self.idle_client.fileno()
+        except Exception:
+            return None
+
+    """ Changed subsystems reported by idle since the last call """
+    def _idle_changes(self):
+        changes = set()
+        if not self.idle_client:
+            return changes
+
+        if select.select([self.idle_client], [], [], 0)[0]:
+            changes.update(self.idle_client.fetch_idle())
+            self.idle_client.send_idle(*self.idle_subsystems)
+            self.logger.debug("MPD idle: %s" % ", ".join(changes))
+        return changes
+
+    def _keepalive(self):
+        if monotonic() - self.ping_time > self.ping_interval:
+            self._command("ping", "ping")
+            self.ping_time = monotonic()
+
+    """ Run one command, counting the round trip for operation """
+    def _command(self, operation, command, *args):
+        result = getattr(self.client, command)(*args)
+        self._roundtrip(operation, command)
+        return result
+
+    """ Run commands, (command, args...) tuples, in one command list round trip.
+        Return value: list of results """
+    def _command_list(self, operation, *commands):
+        self.client.command_list_ok_begin()
+        try:
+            for command in commands:
+                getattr(self.client, command[0])(*command[1:])
+        finally:
+            results = self.client.command_list_end()
+        self._roundtrip(operation, ", ".join(command[0] for command in commands))
+        return results
+
+    def _roundtrip(self, operation, commands):
+        self.roundtrips[operation] = self.roundtrips.get(operation, 0) + 1
+        self.logger.debug("MPD %s: 1 round trip (%s), %d in total" % (operation, commands, self.roundtrips[operation]))
+
+    def _update_status(self, status):
+        self.status_stale = False
+
+        # Check for changes in status
+        if status != self.data["status"]:
+            if status["state"] != self.data["status"]["state"]:
+                self.data["update"]["state"] = True
+                # Started playing - request active status
+                if status["state"] == "play":
+                    self.data["update"]["active"] = True
+            if status["repeat"] != self.data["status"]["repeat"]:
+                self.data["update"]["repeat"]  = True
+            if status["random"] != self.data["status"]["random"]:
+                self.data["update"]["random"]  = True
+            if status["volume"] != self.data["status"]["volume"]:
+                self.data["update"]["volume"]  = True
+            if status["state"] != "stop":
+                if status["elapsed"] != self.data["status"]["elapsed"]:
+                    self.data["update"]["elapsed"] = True
+                self.elapsed_base = float(status["elapsed"])
+                self.elapsed_time = monotonic()
+            else:
+                status["elapsed"] = ""
+
+            # Save new status
+            self.data["status"] = status
+
+    """ Count elapsed time forward while playing, update once a second """
+    def _update_elapsed(self):
+        if self.data["status"]["state"] != "play":
+            return
+
+        elapsed = self.elapsed_base + monotonic() - self.elapsed_time
+        try:
+            if self.data["song"]["time"]:
+                elapsed = min(elapsed, float(self.data["song"]["time"]))
+            previous = int(float(self.data["status"]["elapsed"]))
+        except ValueError:
+            previous = -1
+
+        if int(elapsed) != previous:
+            self.data["status"] = dict(self.data["status"], elapsed="%.3f" % elapsed)
+            self.data["update"]["elapsed"] = True
+
+    def _update_song(self, song):
+        self.song_stale = False
+
+        # Sanity check
+        if "pos" not in song:
+            song["pos"] = ""
+
+        if "artist" not in song:
+            song["artist"] = ""
+
+        if "album" not in song:
+            song["album"] = ""
+
+        if "date" not in song:
+            song["date"] = ""
+
+        if "track" not in song:
+            song["track"] = ""
+
+        if "title" not in song:
+            song["title"] = ""
+
+        if "time" not in song:
+            song["time"] = ""
+
+        # Tags with several values come as lists
+        for tag in ("artist", "album", "date", "track", "title"):
+            song[tag] = tag_value(song, tag)
+
+        # Fetch coverart, but only if we have an album
+        if song["album"] and (self.data["song"]["album"] != song["album"]):
+            self.logger.debug("MPD coverart changed, fetching...")
+            key = cover_key(song["artist"], song["album"])
+            self.request_coverart(key, functools.partial(self.fetch_coverart, song, key))
+
+        # Check for changes in song
+        if song != self.data["song"]:
+            if (
+                    song["pos"]    != self.data["song"]["pos"]    or
+                    song["artist"] != self.data["song"]["artist"] or
+                    song["album"]  != self.data["song"]["album"]  or
+                    song["date"]   != self.data["song"]["date"]   or
+                    song["track"]  != self.data["song"]["track"]  or
+                    song["title"]  != self.data["song"]["title"]  or
+                    song["time"]   != self.data["song"]["time"]
+            ):
+                self.data["update"]["trackinfo"] = True
+            if song["album"] != self.data["song"]["album"]:
+                self.data["update"]["coverart"] = True
+            if song["time"] != self.data["song"]["time"]:
+                self.data["update"]["elapsed"] = True
+
+            # Save new song info
+            self.data["song"] = song
+
+            # Highlight the current song in the playlist
+            if isinstance(self.data["list"]["content"], PlaylistWindow):
+                try:
+                    self.data["list"]["highlight"] = int(song["pos"])
+                except ValueError:
+                    self.data["list"]["highlight"] = -1
+                self.data["update"]["list"] = True
+
     def connect(self):
         if not self.noConnection:
             self.logger.info("Trying to connect to MPD server")
@@ -153,16 +283,37 @@ class MPDControl (PlayerBase):
         client = MPDClient()
         client.timeout = 30
         client.idletimeout = None
+        idle_client = None
         if not self.client:
              try:
                 client.connect(self.config.mpd_host, self.config.mpd_port)
+
+                # Idle connection: no timeout while waiting for changes
+                idle_client = MPDClient()
+                idle_client.timeout = 30
+                idle_client.idletimeout = None
+                idle_client.connect(self.config.mpd_host, self.config.mpd_port)
+                idle_client.send_idle(*self.idle_subsystems)
+
                 self.client = client
+                self.idle_client = idle_client
+                self.status_stale = True
+                self.song_stale   = True
+                self.library_stale = True
+                self.ping_time    = monotonic()
                 self.logger.info("Connection to MPD server established.")
                 self.noConnection = False
                 self.capabilities["connected"]   = True
              except Exception as e:
                 if not self.noConnection:
                     self.logger.error(e)
+                # Close what was opened, or every retry would leave a connection behind
+                for connection in (client, idle_client):
+                    if connection:
+                        try:
+                            connection.disconnect()
+                        except Exception:
+                            pass
                 self._disconnected()
                 self.noConnection = True
                 self.capabilities["connected"]   = False
@@ -177,77 +328,91 @@ class MPDControl (PlayerBase):
             self.logger.info("Lost connection to MPD server")
         self.capabilities["connected"]   = False
         self.init_data()
+        for connection in (self.client, self.idle_client):
+            if connection:
+                try:
+                    connection.disconnect()
+                except Exception:
+                    pass
         self.client = None
+        self.idle_client = None
 
     def disconnect(self):
-        # Close MPD connection
+        # Close MPD connections
         if self.client:
             self.client.close()
             self.client.disconnect()
             self.logger.debug("Disconnected from MPD")
+        if self.idle_client:
+            self.idle_client.disconnect()
 
+    @queued
     def control(self, command, parameter=-1):
         try:
             if self.client:
                 if command == "next":
-                    self.client.next()
+                    self._command("control", "next")
                 elif command == "previous":
-                    self.client.previous()
+                    self._command("control", "previous")
                 elif command == "pause":
-                    self.client.pause()
+                    self._command("control", "pause")
                 elif command == "play":
-                    self.client.play()
+                    self._command("control", "play")
                 elif command == "stop":
-                    self.client.stop()
+                    self._command("control", "stop")
                 elif command == "rwd":
-                    self.client.seekcur("-10")
+                    self._command("control", "seekcur", "-10")
                 elif command == "ff":
-                    self.client.seekcur("+10")
+                    self._command("control", "seekcur", "+10")
                 elif command == "seek" and parameter != -1:
                     seektime = parameter*float(self.data["song"]["time"])
-                    self.client.seekcur(seektime)
+                    self._command("control", "seekcur", seektime)
                 elif command == "repeat":
                     repeat = (int(self.data["status"]["repeat"]) + 1) % 2
-                    self.client.repeat(repeat)
+                    self._command("control", "repeat", repeat)
                 elif command == "random":
                     random = (int(self.data["status"]["random"]) + 1) % 2
-                    self.client.random(random)
+                    self._command("control", "random", random)
                 elif command == "volume" and parameter != -1:
-                    self.client.setvol(parameter)
+                    self._command("control", "setvol", parameter)
         except Exception as e:
             self.logger.error(e)
             self._disconnected()
 
+    @queued
     def load_playlist(self, playlist, clear=False):
         try:
             if self.client:
                 if clear:
-                    self.client.clear()
-                self.client.load(playlist)
-                if clear:
-                    self.play_item(0)
+                    self._command_list("load_playlist", ("clear",), ("load", playlist), ("play", 0))
+                else:
+                    self._command("load_playlist", "load", playlist)
         except Exception as e:
             self.logger.error(e)
             self._disconnected()
             
+    @queued
     def remove_playlist_item(self, item):
         self.logger.debug("Removing playlist item %s" % item)
         if self.client:
-            self.client.delete(item)
+            self._command("remove_playlist_item", "delete", item)
 
+    @queued_listcontent
     def get_playlists(self):
         self.data["list"]["type"] = "playlists"
         self.data["list"]["content"] = []
         self.data["list"]["viewcontent"] = self.data["list"]["content"]
         self.data["list"]["highlight"] = -1
         self.data["list"]["position"]  = 0
+        self.data["list"]["offset"]    = None
+        self.data["list"]["jump"]      = None
         self.data["list"]["click"] = self.playlists_click
         self.data["list"]["buttons"] = [{"name"  : "append",
                                          "icon"  : self.capabilities["listbuttons"]["add"]["icon"],
                                          "action" : self.load_playlist}]
         try:
             if self.client:
-                playlists = self.client.listplaylists()
+                playlists = self._command("get_playlists", "listplaylists")
                 for item in playlists:
                     listitem = ""
                     if "playlist" in item:
@@ -257,67 +422,182 @@ class MPDControl (PlayerBase):
             self.logger.error(e)
             self._disconnected()
 
+    @locked_or_queued
     def get_playlist(self):
         self.data["list"]["type"] = "playlist"
-        self.data["list"]["content"] = []
-        self.data["list"]["viewcontent"] = self.data["list"]["content"]
         self.data["list"]["click"] = self.playlist_click
         self.data["list"]["buttons"] = [{"name"  : "remove",
                                          "icon"  : self.capabilities["listbuttons"]["remove"]["icon"],
                                          "action" : self.remove_playlist_item}]
         try:
-            # Todo: not updating when list is shown
-            # Todo: Wrong item highlighted when removing playlist items
             self.data["list"]["highlight"] = int(self.data["song"]["pos"])
             self.data["list"]["position"]  = int(self.data["song"]["pos"])
         except Exception as e:
             self.data["list"]["highlight"] = -1
             self.data["list"]["position"]  = 0
+        self.data["list"]["offset"] = None
+        self.data["list"]["jump"]   = None
 
+        # Rows are loaded by the poller thread when the list view asks for them
         try:
-            if self.client:
-                playlist = self.client.playlistinfo()
-
-                if playlist:
-                    # Parse content
-                    for item in playlist:
-                        listitem = ""
-                        if "title" in item:
-                            listitem = str(item["title"])
-                            if "artist" in item:
-                                listitem = str(item["artist"]) + " - " + listitem
-                            if "id" in item:
-                                pos = str(int(item["pos"])+1).rjust(4, ' ')
-                                listitem = pos + ". " + listitem
-                        # No title, get filename
-                        elif "file" in item:
-                            listitem = item["file"].split("/")[-1]
-                        self.data["list"]["content"].append(listitem)
+            length = int(self.data["status"]["playlistlength"])
+        except Exception:
+            length = 0
+        self.data["list"]["content"] = PlaylistWindow(length, format_playlist_item, self.data["status"].get("playlist"),
+                                                      wake=self.wake)
+        self.data["list"]["viewcontent"] = self.data["list"]["content"]
+
+    """ Bring the loaded playlist pages up to the queue version in status """
+    def _sync_playlist(self):
+        window = self.data["list"]["content"]
+        if not isinstance(window, PlaylistWindow):
+            return
+
+        playlist_version = self.data["status"].get("playlist")
+        if window.playlist_version == playlist_version:
+            return
 
+        length = int(self.data["status"]["playlistlength"])
+        try:
+            if window.playlist_version is None:
+                window.reset(length, playlist_version)
+            else:
+                # Positions whose song changed since the version shown
+                previous = window.playlist_version
+                changes = self._command("sync_playlist", "plchangesposid", previous)
+                missing = window.patch(length, [(int(change["cpos"]), change["id"]) for change in changes],
+                                       playlist_version)
+                if missing:
+                    results = self._command_list("sync_playlist", *[("playlistid", id) for id in missing])
+                    window.add_songs(song for songs in results for song in songs)
+                self.logger.debug("MPD playlist %s -> %s: %d changes, %d songs fetched" %
+                                  (previous, playlist_version, len(changes), len(missing)))
         except Exception as e:
             self.logger.error(e)
-            self._disconnected()
+            window.reset(length, playlist_version)
+        self.data["update"]["list"] = True
 
-    def list_library(self, type="genre", filtertype="", filter=""):
+    """ Start rebuilding the library index if the database has changed """
+    def _check_library(self):
+        if not self.library_stale or (self.library_thread and self.library_thread.is_alive()):
+            return
+
+        # Checked again on the next database change or reconnect
+        self.library_stale = False
+        try:
+            db_update = self._command("check_library", "stats").get("db_update", "")
+        except (MPDConnectionError, socket.error):
+            raise
+        except Exception as e:
+            self.logger.error("Library check: %s" % e)
+            return
+        if not self.library or self.library.db_update != db_update:
+            self.library_thread = Thread(target=self._build_library, args=(db_update,), name="mpd-library")
+            self.library_thread.daemon = True
+            self.library_thread.start()
+
+    """ Library thread: load the saved index or build it on a connection of its own """
+    def _build_library(self, db_update):
+        start = monotonic()
+        library = LibraryIndex.load(self.library_file)
+        if library and library.db_update == db_update:
+            with self.lock:
+                self.library = library
+                self.library_views.clear()
+            self.logger.info("MPD library index loaded: %d songs in %.2f s" % (library.songs, monotonic() - start))
+            return
+
+        client = MPDClient()
+        client.timeout = 30
+        try:
+            client.connect(self.config.mpd_host, self.config.mpd_port)
+            # Stream the database instead of holding all of it in memory
+            client.iterate = True
+            library = LibraryIndex.build(client.listallinfo(), db_update)
+            client.iterate = False
+            client.disconnect()
+        except Exception as e:
+            self.logger.error("MPD library index: %s" % e)
+            return
+
+        with self.lock:
+            self.library = library
+            self.library_views.clear()
+        self.logger.info("MPD library index built: %d songs in %.2f s" % (library.songs, monotonic() - start))
+        try:
+            library.save(self.library_file)
+        except Exception as e:
+            self.logger.error(e)
+
+    """ Load the playlist pages the list view is waiting for """
+    def _fetch_playlist_pages(self):
+        window = self.data["list"]["content"]
+        if not isinstance(window, PlaylistWindow):
+            return
 
+        pages = window.wanted_pages()
+        if pages:
+            # Pages not loaded are asked for again when the list view reads them
+            try:
+                results = self._command_list("playlist_pages",
+                                             *[("playlistinfo", "%d:%d" % window.page_range(page)) for page in pages])
+            except (MPDConnectionError, socket.error):
+                raise
+            except Exception as e:
+                self.logger.error("Playlist pages: %s" % e)
+                return
+            for page, songs in zip(pages, results):
+                window.add_page(page, songs)
+            self.data["update"]["list"] = True
+
+    """ Library views come from the library index at once; without it the server is asked on the poller thread """
+    def list_library(self, type="genre", filtertype="", filter=""):
+        if self.library:
+            return self._list_library_local(type, filtertype, filter)
+        return self._list_library_server(type, filtertype, filter)
+
+    def _list_library(self, type="genre", filtertype="", filter=""):
+        # Remember the view being left, with the position the list view stored
+        if self.library_view and self.data["list"]["click"] == self.library_click and self.data["list"]["viewcontent"]:
+            self.library_views.put(self.library_view, {"content"     : self.data["list"]["content"],
+                                                       "viewcontent" : self.data["list"]["viewcontent"],
+                                                       "highlight"   : self.data["list"]["highlight"],
+                                                       "offset"      : self.left_list_offset(),
+                                                       "jump"        : self.data["list"]["jump"]})
+
+        self.library_view = (type, filtertype, filter)
         self.data["list"]["type"] = type
         self.data["list"]["content"] = []
         self.data["list"]["viewcontent"] = []
         self.data["list"]["highlight"] = -1
         self.data["list"]["position"]  = 0
+        self.data["list"]["offset"]    = None
+        self.data["list"]["jump"]      = None
         self.data["list"]["click"] = self.library_click
         self.data["list"]["buttons"] = []
         self.data["list"]["buttons"] = [{"name"  : "append",
                                          "icon"  : self.capabilities["listbuttons"]["add"]["icon"],
                                          "action" : self.findadd}]
 
+        # Visited before: show it as it was left
+        view = self.library_views.get(self.library_view)
+        if view:
+            self.data["list"].update(view)
+            return
+
         try:
-            if self.client:
+            if self.library:
+                self.data["list"]["content"] = self.library.list(type, filtertype, filter)
+
+            # Index not ready yet: ask the server
+            elif self.client:
                 if filtertype and filter:
-                    self.data["list"]["content"] = self.client.list(type, filtertype, filter)
+                    content = self._command("list_library", "list", type, filtertype, filter)
                 else:
-                    self.data["list"]["content"] = self.client.list(type)
+                    content = self._command("list_library", "list", type)
+                self.data["list"]["content"] = sorted((item[type] if isinstance(item, dict) else item for item in content), key=sort_key)
 
+            if self.data["list"]["content"]:
                 # Sorting alphabetically is fine
                 if type == "genre" or type == "artist":
                     self.data["list"]["viewcontent"] = self.data["list"]["content"]
@@ -330,32 +610,39 @@ class MPDControl (PlayerBase):
                 elif type == "title" and filtertype == "album":
                     self.data["list"]["viewcontent"] = self.data["list"]["content"]
 
+                # Sorted: the scrollbar can jump by first letter
+                self.data["list"]["jump"] = JumpIndex(self.data["list"]["viewcontent"])
+
         except Exception as e:
             self.logger.error(e)
             self._disconnected()
 
+    _list_library_local  = locked_or_queued(_list_library)
+    _list_library_server = queued_listcontent(_list_library)
+
+    @queued
     def play_item(self, number):
         try:
             if self.client:
-                self.client.play(number)
+                self._command("play_item", "play", number)
         except Exception as e:
             self.logger.error(e)
             self._disconnected()
 
+    @queued
     def findadd(self, type, item, clear="False"):
         try:
             if self.client:
                 if clear:
-                    self.client.clear()
-                self.client.findadd(type, item)
-                if clear:
-                    self.play_item(0)
+                    self._command_list("findadd", ("clear",), ("findadd", type, item), ("play", 0))
+                else:
+                    self._command("findadd", "findadd", type, item)
         except Exception as e:
             self.logger.error(e)
             self._disconnected()
 
     def playlists_click(self, item=-1, button=1):
-        playlist = self.data["list"]["content"][item]
+        playlist = self.view["list"]["content"][item]
         try:
             # Scrolled left
             if button == -1:
@@ -379,7 +666,7 @@ class MPDControl (PlayerBase):
 
             # Scroll: Activate menu item
             elif button >= 3:
-                selection = self.data["list"]["buttons"][button-3]
+                selection = self.view["list"]["buttons"][button-3]
                 if selection["action"]:
                     selection["action"](playlist, False)
 
@@ -416,10 +703,10 @@ class MPDControl (PlayerBase):
 
             # Scroll: Activate menu item and stay
             elif button >= 3:
-                selection = self.data["list"]["buttons"][button-3]
+                selection = self.view["list"]["buttons"][button-3]
+                # The list follows the queue change reported by idle
                 if selection["action"]:
                     selection["action"](item)
-                    self.get_playlist()
 
                 self.logger.debug("Playlist item scrolled: %s" % button)
                 return "listview"
@@ -428,20 +715,19 @@ class MPDControl (PlayerBase):
             self.logger.error(e)
         return ""
 
-    # TODO: Remember previous scroll position when navigating back
     def library_click(self, item=-1, button=1):
         try:
-            selected = self.data["list"]["content"][item]
+            selected = self.view["list"]["content"][item]
 
             # Scrolled left
             if button == -1:
-                if self.data["list"]["type"] == "title" and self.previouslibraryview["artist"]:
+                if self.view["list"]["type"] == "title" and self.previouslibraryview["artist"]:
                     self.list_library("album", "artist", self.previouslibraryview["artist"])
                     return "listview"
-                elif self.data["list"]["type"] == "album" and self.previouslibraryview["genre"]:
+                elif self.view["list"]["type"] == "album" and self.previouslibraryview["genre"]:
                     self.list_library("artist", "genre", self.previouslibraryview["genre"])
                     return "listview"
-                elif self.data["list"]["type"] == "artist":
+                elif self.view["list"]["type"] == "artist":
                     self.list_library("genre")
                     return "listview"
                 else:
@@ -456,37 +742,37 @@ class MPDControl (PlayerBase):
             # Normal click: navigate library or add to playlist
             elif button == 1:
                 # Last view was genres -> show artists for genre
-                if self.data["list"]["type"] == "genre":
+                if self.view["list"]["type"] == "genre":
                     self.previouslibraryview["genre"] = selected
                     self.list_library("artist", "genre", selected)
                     return "listview"
 
                 # Last view was artists -> show albums for artist
-                elif self.data["list"]["type"] == "artist":
+                elif self.view["list"]["type"] == "artist":
                     self.previouslibraryview["artist"] = selected
                     self.list_library("album", "artist", selected)
                     return "listview"
 
                 # Last view was albums -> show songs for album
-                elif self.data["list"]["type"] == "album":
+                elif self.view["list"]["type"] == "album":
                     self.list_library("title", "album", selected)
                     return "listview"
 
                 # Last view was songs -> play item
-                elif self.data["list"]["type"] == "title":
-                    self.findadd(self.data["list"]["type"], selected, True)
+                elif self.view["list"]["type"] == "title":
+                    self.findadd(self.view["list"]["type"], selected, True)
                     return ""
 
             # Longpress: Replace in playlist and stay
             elif button == 2:
-                self.findadd(self.data["list"]["type"], selected, True)
+                self.findadd(self.view["list"]["type"], selected, True)
                 return "listview"
 
             # Scroll: Activate menu item and stay
             elif button >= 3:
-                selection = self.data["list"]["buttons"][button-3]
+                selection = self.view["list"]["buttons"][button-3]
                 if selection["action"]:
-                    selection["action"](self.data["list"]["type"], selected, False)
+                    selection["action"](self.view["list"]["type"], selected, False)
 
                 self.logger.debug("Library item scrolled: %s" % button)
                 return "listview"
@@ -495,10 +781,59 @@ class MPDControl (PlayerBase):
             self.logger.error(e)
             return ""
 
-    def fetch_coverart(self, song):
-        self.data["cover"] = False
-        self.data["coverartfile"]=""
+    """ Queue cover art of the songs after the current one to be fetched and cached """
+    def _prefetch_coverart(self):
+        status = self.data["status"]
+        if not self.prefetch_count or "nextsongid" not in status:
+            return
+        # Same next song in the same queue: already done
+        upcoming = (status["nextsongid"], status.get("playlist"))
+        if upcoming == self.prefetch_next:
+            return
+        self.prefetch_next = upcoming
+
+        # Optional: errors other than a broken connection only skip the prefetch
+        try:
+            # In random order only the next song is known
+            if self.prefetch_count == 1 or status["random"] == "1":
+                songs = self._command("prefetch", "playlistid", status["nextsongid"])
+            else:
+                start = int(status["nextsong"])
+                songs = self._command("prefetch", "playlistinfo", "%d:%d" % (start, start + self.prefetch_count))
+
+            albums = set([self.data["song"].get("album", "")])
+            for slot, song in enumerate(songs[:self.prefetch_count]):
+                song = dict(song, artist=tag_value(song, "artist"), album=tag_value(song, "album"))
+                if not song["album"] or song["album"] in albums:
+                    continue
+                albums.add(song["album"])
+                key = cover_key(song["artist"], song["album"])
+                if key in cover_cache:
+                    cover_fetcher.cancel((self, slot))
+                    continue
+                self.logger.debug("Prefetching coverart: %s" % song["album"])
+                cover_fetcher.submit((self, slot), key, functools.partial(self.prefetch_coverart, song, key),
+                                     lambda key, coverartfile: None)
+        except (MPDConnectionError, socket.error):
+            raise
+        except Exception as e:
+            self.logger.error("Coverart prefetch: %s" % e)
 
+    """ Cover worker thread: fetch cover art and store it scaled in the cover cache. Return value: cover art file """
+    def prefetch_coverart(self, song, key):
+        coverartfile = self.fetch_coverart(song, key)
+        if coverartfile and key not in cover_cache:
+            try:
+                cover_cache.load(key, coverartfile)
+                # The download isn't needed once cached
+                if coverartfile.startswith(self.config.logpath):
+                    os.remove(coverartfile)
+            except Exception as e:
+                self.logger.error(e)
+        return coverartfile
+
+    """ Cover worker thread. Return value: cover art file of song, "" if none found """
+    def fetch_coverart(self, song, key):
         # Search for local coverart
         if "file" in song and self.config.library_path:
 
@@ -524,14 +859,12 @@ class MPDControl (PlayerBase):
                 if coverartfile:
                     # Image found, load it
                     self.logger.debug("Using MPD coverart: %s" % coverartfile)
-                    self.data["coverartfile"] = coverartfile
-                    self.data["cover"] = True
-                    self.data["update"]["coverart"] = True
+                    return coverartfile
                 else:
                     self.logger.debug("No local coverart file found, switching to Last.FM")
 
         # No existing coverart, try to fetch from LastFM
-        if not self.data["cover"] and self.lfm_connected:
+        if self.lfm_connected:
 
             try:
                 lastfm_album = self.lfm.get_album(song["artist"], song["album"])
@@ -545,14 +878,14 @@ class MPDControl (PlayerBase):
                 try:
                     coverart_url = lastfm_album.get_cover_image(2)
                     if coverart_url:
-                        self.data["coverartfile"] = self.config.logpath + "/mpd_cover.png"
-                        subprocess.check_output("wget -q %s -O %s" % (coverart_url, self.data["coverartfile"]), shell=True )
+                        coverartfile = self.coverart_download_file(key)
+                        downloader.get(coverart_url, coverartfile)
                         self.logger.debug("MPD coverart downloaded from Last.fm")
-                        self.data["cover"] = True
-                        self.data["update"]["coverart"] = True
+                        return coverartfile
                 except Exception as e:
                     self.logger.error(e)
                     pass
+        return ""
 
     def connect_lfm(self):
         self.logger.info("Setting Pylast")
@@ -564,4 +897,26 @@ class MPDControl (PlayerBase):
         except:
             self.lfm = ""
             time.sleep(5)
-            self.logger.debug("Last.fm not connected")
\ No newline at end of file
+            self.logger.debug("Last.fm not connected")
+
+""" Tag of song as text: "" if missing, several values joined """
+def tag_value(song, tag):
+    value = song.get(tag, "")
+    if isinstance(value, list):
+        return ", ".join(value)
+    return value
+
+""" Playlist row: position, artist and title, or the file name """
+def format_playlist_item(item):
+    listitem = ""
+    if "title" in item:
+        listitem = str(item["title"])
+        if "artist" in item:
+            listitem = str(item["artist"]) + " - " + listitem
+        if "id" in item:
+            pos = str(int(item["pos"])+1).rjust(4, ' ')
+            listitem = pos + ". " + listitem
+    # No title, get filename
+    elif "file" in item:
+        listitem = item["file"].split("/")[-1]
+    return listitem
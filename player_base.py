@@ -1,12 +1,88 @@
 # -*- coding: utf-8 -*-
+import os
+import errno
+import fcntl
 import logging
+import functools
+from collections import namedtuple, deque
+from threading import Lock, RLock
+
+from cover_cache import cover_cache
+from cover_fetcher import cover_fetcher
+
+# Player state published by the poller thread to the UI thread.
+# changes: names of the update flags raised since the previous snapshot
+PlayerSnapshot = namedtuple("PlayerSnapshot", ["status", "song", "cover", "coverartfile", "coverkey", "list", "menu", "changes"])
+
+""" Decorator: run on the poller thread with the lock held. The call returns at once """
+def queued(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.queue_command(functools.partial(method, self, *args, **kwargs))
+    return wrapper
+
+"""
+Decorator for methods building list content without talking to the
+backend. Runs at once if the player lock is free; if the poller is busy
+with the backend, the call is left to the poller, which raises the
+"listcontent" update when done.
+Return value: False if left to the poller
+"""
+def locked_or_queued(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.lock.acquire(False):
+            try:
+                result = method(self, *args, **kwargs)
+                self.show_list()
+                return result
+            finally:
+                self.lock.release()
+
+        self.logger.debug("Player busy, %s left to the poller" % method.__name__)
+        self.queue_listcontent(functools.partial(method, self, *args, **kwargs))
+        return False
+    return wrapper
+
+"""
+Decorator for methods building list content from the backend. Always left
+to the poller, which raises the "listcontent" update when done.
+Return value: False
+"""
+def queued_listcontent(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.queue_listcontent(functools.partial(method, self, *args, **kwargs))
+        return False
+    return wrapper
 
 class PlayerBase(object):
     def __init__(self, name, config):
         self.logger = logging.getLogger("PiTFT-Playerui." + name)
-        self.coverartThread = None
         self.config = config
 
+        # Cover key the player waits for, and the last cover art file downloaded
+        self.coverart_pending  = ""
+        self.coverart_download = ""
+
+        # Guards the connection and self.data. Held by the poller during refresh
+        self.lock = RLock()
+
+        # Calls from the UI thread waiting for the poller thread, and a pipe
+        # waking the poller up for them. The UI thread never waits for the lock
+        self.commands = deque()
+        self.wake_read, self.wake_write = os.pipe()
+        for fd in (self.wake_read, self.wake_write):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        # Latest snapshot not yet collected by the UI thread
+        self.snapshot = None
+        self.snapshot_lock = Lock()
+
+        # (list content, offset) where the UI thread left the list view
+        self.list_offset = (None, None)
+
         # Capabilities
         self.capabilities = {
             "name"            : name,
@@ -26,6 +102,7 @@ class PlayerBase(object):
             "song"   : {},
             "cover"  : False,
             "coverartfile" : "",
+            "coverkey" : "",
             "update" : {},
             "list" :
             {
@@ -35,12 +112,27 @@ class PlayerBase(object):
                 "click"       : self.list_click,
                 "highlight"   : -1,
                 "position"    :  0,
+                "offset"      : None,
+                "jump"        : None,
                 "buttons"     : []
             },
             "menu" : []
         }
         self.init_data()
-        
+
+        # UI thread's view of the published data
+        self.view = {
+            "status"       : dict(self.data["status"]),
+            "song"         : dict(self.data["song"]),
+            "cover"        : self.data["cover"],
+            "coverartfile" : self.data["coverartfile"],
+            "coverkey"     : self.data["coverkey"],
+            "list"         : dict(self.data["list"]),
+            "menu"         : list(self.data["menu"]),
+            "update"       : dict.fromkeys(self.data["update"], True)
+        }
+        self.view["update"]["active"] = False
+
     def init_data (self):
         self.data["status"] = {
                 "state"       : "",
@@ -62,6 +154,11 @@ class PlayerBase(object):
             }
         self.data["cover"] = False
         self.data["coverartfile"] = ""
+        self.data["coverkey"] = ""
+        # Nothing pending: after a reconnect the same cover is asked for again
+        self.coverart_pending = ""
+        self.coverart_download = ""
+        cover_fetcher.cancel(self)
         self.data["update"] = {
                 "active"      : False,
                 "state"       : True,
@@ -70,11 +167,64 @@ class PlayerBase(object):
                 "repeat"      : True,
                 "volume"      : True,
                 "trackinfo"   : True,
-                "coverart"    : True
+                "coverart"    : True,
+                "list"        : False,
+                "listcontent" : False
             }
             
-    """ Get data """
+    """
+    Show cover art for key. Cached covers are taken into use right away,
+    others are fetched on the cover worker threads: fetch() returns the
+    image file, or "" if none was found. Called with the lock held
+    """
+    def request_coverart(self, key, fetch):
+        # Already shown or being fetched
+        if key == self.coverart_pending:
+            return
+
+        self.data["cover"] = False
+        self.data["coverartfile"] = ""
+        self.data["coverkey"] = ""
+        self.coverart_pending = key
+
+        if key in cover_cache:
+            self.logger.debug("Using cached coverart")
+            self.data["cover"] = True
+            self.data["coverkey"] = key
+            self.data["update"]["coverart"] = True
+            cover_fetcher.cancel(self)
+        else:
+            cover_fetcher.submit(self, key, fetch, self._coverart_fetched)
+
+    """ Cover worker thread: fetch done """
+    def _coverart_fetched(self, key, coverartfile):
+        with self.lock:
+            # Track changed again while fetching
+            if key != self.coverart_pending:
+                return
+            self.logger.debug("Coverart fetched: %s" % coverartfile)
+            self.data["cover"] = bool(coverartfile)
+            self.data["coverartfile"] = coverartfile or ""
+            self.data["coverkey"] = key
+            self.data["update"]["coverart"] = True
+
+            # Downloads are named by key: remove the previous one
+            if self.coverart_download and self.coverart_download != coverartfile:
+                try:
+                    os.remove(self.coverart_download)
+                except OSError:
+                    pass
+            if coverartfile and coverartfile.startswith(self.config.logpath):
+                self.coverart_download = coverartfile
+
+    """ File to download the cover art of key to """
+    def coverart_download_file(self, key):
+        return "%s/%s_cover_%s.png" % (self.config.logpath, self.capabilities["name"], key)
+
+    """ Get data. Status, song, cover, list and menu come from the last collected snapshot """
     def __getitem__(self, item):
+        if item in self.view:
+            return self.view[item]
         return self.data[item]
 
     """ Get capability value """
@@ -87,26 +237,129 @@ class PlayerBase(object):
     def set_buttonicon(self, item, icon):
         self.capabilities["listbuttons"][item]["icon"] = icon
 
-    """ Refresh data from API """
+    """ File descriptor that becomes readable when the player has news, or None """
+    def fileno(self):
+        return None
+
+    """ Queue a call for the poller thread and wake it up """
+    def queue_command(self, command):
+        self.commands.append(command)
+        self.wake()
+
+    """ Queue a list content builder for the poller thread. The list view opens when it is done """
+    def queue_listcontent(self, build):
+        def run():
+            build()
+            self.data["update"]["listcontent"] = True
+        self.queue_command(run)
+
+    """ Wake the poller thread up for a pass """
+    def wake(self):
+        try:
+            os.write(self.wake_write, b"x")
+        except OSError as e:
+            # Pipe full: the poller has a wakeup pending anyway
+            if e.errno != errno.EAGAIN:
+                raise
+
+    """ Poller thread: empty the wakeup pipe """
+    def clear_wake(self):
+        try:
+            while os.read(self.wake_read, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                self.logger.error(e)
+
+    """ Poller thread: run the queued calls. Called with the lock held """
+    def run_commands(self):
+        while self.commands:
+            command = self.commands.popleft()
+            try:
+                command()
+            except Exception as e:
+                self.logger.error(e)
+
+    """ Refresh data from API. Called from the poller thread with the lock held """
     def refresh(self, active=False):
         pass
-        
+
+    """ Poller thread: hand the current data over to the UI thread """
+    def publish(self):
+        with self.lock:
+            changes = frozenset(item for item, value in self.data["update"].items() if value)
+            snapshot = PlayerSnapshot(dict(self.data["status"]),
+                                      dict(self.data["song"]),
+                                      self.data["cover"],
+                                      self.data["coverartfile"],
+                                      self.data["coverkey"],
+                                      dict(self.data["list"]),
+                                      list(self.data["menu"]),
+                                      changes)
+            for item in changes:
+                self.data["update"][item] = False
+
+        with self.snapshot_lock:
+            # Keep the changes of a snapshot the UI has not collected yet
+            if self.snapshot:
+                snapshot = snapshot._replace(changes=changes | self.snapshot.changes)
+            self.snapshot = snapshot
+        return bool(changes)
+
+    """ UI thread: take the latest snapshot into use without waiting """
+    def collect(self):
+        with self.snapshot_lock:
+            snapshot, self.snapshot = self.snapshot, None
+
+        if snapshot:
+            self.view["status"]       = snapshot.status
+            self.view["song"]         = snapshot.song
+            self.view["cover"]        = snapshot.cover
+            self.view["coverartfile"] = snapshot.coverartfile
+            self.view["coverkey"]     = snapshot.coverkey
+            self.view["list"]         = snapshot.list
+            self.view["menu"]         = snapshot.menu
+            for item in snapshot.changes:
+                self.view["update"][item] = True
+        return snapshot is not None
+
+    """ UI thread: show list content just built, with the lock held """
+    def show_list(self):
+        content = dict(self.data["list"])
+        self.view["list"] = content
+        # An older snapshot waiting to be collected would bring the old list back
+        with self.snapshot_lock:
+            if self.snapshot:
+                self.snapshot = self.snapshot._replace(list=content)
+
+    """ UI thread: remember where the list view was left """
+    def set_list_offset(self, offset):
+        self.view["list"]["offset"] = offset
+        self.list_offset = (self.view["list"]["content"], offset)
+
+    """ Return value: offset where the UI left the list being built over """
+    def left_list_offset(self):
+        content, offset = self.list_offset
+        if content is self.data["list"]["content"]:
+            return offset
+        return self.data["list"]["offset"]
+
     def updated(self, item="all"):
         if item == "all":
-            return True in self.data["update"].values()
+            return True in self.view["update"].values()
         else:
-            return self.data["update"][item]
+            return self.view["update"][item]
 
     """ Force an update """
     def force_update (self,item="all"):
         if item == "all":
-            self.data["update"] = dict.fromkeys(self.data["update"], True)
+            self.view["update"] = dict.fromkeys(self.view["update"], True)
         else:
-            self.data["update"][item] = True
+            self.view["update"][item] = True
 
     """ Acknowledge an update request """
     def update_ack(self, item):
-        self.data["update"][item] = False
+        self.view["update"][item] = False
 
     """ Control the player via API """
     def control(self, command, parameter=-1):
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+
+class PlaylistWindow(object):
+    """
+    List content for a long play queue, loaded a page at a time.
+
+    The UI thread reads rows like from a list. Rows of pages not loaded yet
+    read as "" and the page is queued; the player's poller thread fetches
+    queued pages with wanted_pages() and add_page(), and applies queue
+    changes with patch(). wake() is called to get the poller going when a
+    page is queued. Rows are formatted on first access and pages far
+    from the viewed position are dropped. version changes whenever loaded
+    content changes; playlist_version is the server's queue version the
+    loaded pages are in sync with.
+    """
+    def __init__(self, length, format, playlist_version=None, page_size=100, max_pages=20, wake=None):
+        self.length    = length
+        self.format    = format
+        self.wake      = wake
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages     = {}  # Page number: list of song dicts, None if not known
+        self.rows      = {}  # Page number: list of formatted rows, None if not formatted
+        self.wanted    = []  # Page numbers to load
+        self.loading   = set() # Page numbers being loaded by the poller
+        self.current   = 0   # Page last read
+        self.version   = 0
+        self.playlist_version = playlist_version
+        self.lock      = Lock()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("playlist index out of range")
+
+        page, offset = divmod(index, self.page_size)
+        queued = False
+        with self.lock:
+            self.current = page
+            # Load neighbours before they are scrolled to
+            for wanted in (page, page + 1, page - 1):
+                if 0 <= wanted*self.page_size < self.length and wanted not in self.pages and wanted not in self.wanted and wanted not in self.loading:
+                    self.wanted.append(wanted)
+                    queued = True
+
+            songs = self.pages.get(page)
+            if songs is None or offset >= len(songs) or songs[offset] is None:
+                row = ""
+            else:
+                rows = self.rows[page]
+                if rows[offset] is None:
+                    rows[offset] = self.format(songs[offset])
+                row = rows[offset]
+
+        # Fetch now instead of on the next poll
+        if queued and self.wake:
+            self.wake()
+        return row
+
+    """ Return value: (start, end) range of page for playlistinfo """
+    def page_range(self, page):
+        start = page*self.page_size
+        return start, min(start + self.page_size, self.length)
+
+    """ Pages to load, closest to the viewed position first """
+    def wanted_pages(self, limit=4):
+        with self.lock:
+            # Pages scrolled past long ago would be dropped right away
+            self.wanted = [page for page in self.wanted if abs(page - self.current) <= self.max_pages//2]
+            self.wanted.sort(key=lambda page: abs(page - self.current))
+            pages, self.wanted = self.wanted[:limit], self.wanted[limit:]
+            # Pages of an earlier pass not added failed, and may be queued again
+            self.loading = set(pages)
+            return pages
+
+    def add_page(self, page, songs):
+        with self.lock:
+            self.pages[page] = list(songs)
+            self.loading.discard(page)
+            self.rows[page] = [None]*len(songs)
+            while len(self.pages) > self.max_pages:
+                farthest = max(self.pages, key=lambda loaded: abs(loaded - self.current))
+                del self.pages[farthest]
+                del self.rows[farthest]
+            self.version += 1
+
+    """
+    Apply queue changes: (position, song id) pairs from plchangesposid
+    and the new length. Songs moved within the loaded pages are reused.
+    Return value: ids of songs to fetch for add_songs()
+    """
+    def patch(self, length, changes, playlist_version):
+        with self.lock:
+            loaded = {}
+            for songs in self.pages.values():
+                for song in songs:
+                    if song:
+                        loaded[song["id"]] = song
+
+            # Drop what is past the new end
+            self.length = length
+            for page in list(self.pages):
+                start, end = self.page_range(page)
+                if start >= end:
+                    del self.pages[page]
+                    del self.rows[page]
+                else:
+                    del self.pages[page][end - start:]
+                    del self.rows[page][end - start:]
+
+            missing = []
+            for position, id in changes:
+                page, offset = divmod(position, self.page_size)
+                if page not in self.pages or position >= length:
+                    continue
+                songs = self.pages[page]
+                if offset >= len(songs):
+                    songs.extend([None]*(offset + 1 - len(songs)))
+                    self.rows[page].extend([None]*(offset + 1 - len(self.rows[page])))
+                if id in loaded:
+                    songs[offset] = dict(loaded[id], pos=str(position))
+                else:
+                    songs[offset] = None
+                    missing.append(id)
+                self.rows[page][offset] = None
+
+            self.playlist_version = playlist_version
+            self.version += 1
+            return missing
+
+    """ Put songs with their current position into the loaded pages """
+    def add_songs(self, songs):
+        with self.lock:
+            for song in songs:
+                page, offset = divmod(int(song["pos"]), self.page_size)
+                if page in self.pages and offset < len(self.pages[page]):
+                    self.pages[page][offset] = song
+                    self.rows[page][offset] = None
+            self.version += 1
+
+    """ Drop all loaded pages, e.g. when the queue changes can't be patched """
+    def reset(self, length, playlist_version=None):
+        with self.lock:
+            self.length = length
+            self.pages.clear()
+            self.rows.clear()
+            self.wanted = []
+            self.playlist_version = playlist_version
+            self.version += 1
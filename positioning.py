@@ -1,4 +1,6 @@
+import pygame
 import config
+from lru_cache import LRUCache
 ###################
 # Font colors
 ###################
@@ -7,6 +9,7 @@ color = {}
 color["inactive"]   = 50,46,44
 color["text"]       = 230,228,227
 color["highlight"]  = 230,228,0
+color["overlay"]    = 20,19,18
 
 ###################
 # Sizes
@@ -45,6 +48,7 @@ size["scrollbar"]            = 20, size["screen"][1]
 size["scrollbar_click"]      = 60, config.resolution[1]
 size["scrollbar_slider"]     = 20, size["scrollbar"][1]-28
 size["listbutton"]           = 20, 20
+size["jumpletter"]           = 80, 80
 
 
 
@@ -112,6 +116,11 @@ _pos["logoback"]      = _pos["logo"][0] - size["padding"][0], _pos["logo"][1] -
 _pos["scrollbar"]        = _pos["right"] -size["scrollbar"][0]/2 - 2, _pos["top"]
 _pos["scrollbar_click"]  = _pos["scrollbar"][0]-size["scrollbar_click"][0], 0
 _pos["scrollbar_slider"] = _pos["scrollbar"][0]+4, _pos["scrollbar"][1]+12
+_pos["jumpletter"]       = _pos["center"][0] - size["jumpletter"][0]/2, _pos["center"][1] - size["jumpletter"][1]/2
+
+# Widths for text: track info ends at the player logo, list items at the scrollbar
+size["trackinfo_text"]   = _pos["logoback"][0] - _pos["track"][0] - size["padding"][0]
+size["listitem_text"]    = _pos["scrollbar"][0] - _pos["listview"][0] - size["padding"][0]
 
 ###########################
 # Helper functions
@@ -143,7 +152,7 @@ def render_menuitem(text, font, color_str, menu, index, offset, direction="up"):
     if direction == "up":
         offset = (offset[0], offset[1] - index*size[menu])
 
-    text = _render_text(text, font, color_str)
+    text = render_text(text, font, color_str)
 
     text_rect = text.get_rect(center=(config.resolution[0]/2, 0))
     offset = (offset[0] - text_rect[0], offset[1])
@@ -161,8 +170,63 @@ def menupos(item, number, offset, direction="down"):
 def pos(position, offset=(0,0)):
     return _pos[position][0] + offset[0], _pos[position][1] + offset[1]
 
+# Rendered text surfaces by (text, font, color). Limited to 512 surfaces and 4 MB of pixels
+text_cache = LRUCache(512, 4*1024*1024,
+                      lambda surface: surface.get_width()*surface.get_height()*surface.get_bytesize())
+
+# The returned surface is shared: blit it, don't draw on it
 def render_text(text, font, color_str="text"):
-    return font.render(text, 1, color[color_str])
+    key = (text, font, color_str)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = font.render(text, 1, color[color_str])
+        text_cache.put(key, surface)
+    return surface
+
+# Texts cut to width by (text, font, max width)
+fit_cache = LRUCache(1024)
+
+# Cut text with an ellipsis to fit in max_width pixels, searching the cut
+# point with font.size. Text should be unicode
+def fit_text(text, font, max_width):
+    key = (text, font, max_width)
+    fitted = fit_cache.get(key)
+    if fitted is None:
+        fitted = text
+        if font.size(text)[0] > max_width:
+            # Longest start of text that fits with the ellipsis
+            low, high = 0, len(text) - 1
+            while low < high:
+                middle = (low + high + 1)//2
+                if font.size(text[:middle].rstrip() + u"\u2026")[0] <= max_width:
+                    low = middle
+                else:
+                    high = middle - 1
+            fitted = text[:low].rstrip() + u"\u2026"
+        fit_cache.put(key, fitted)
+    return fitted
+
+# Combine overlapping or touching rects for display updates.
+# Full screen if the merged area covers most of it anyway
+def merge_rects(rects, full_ratio=0.6):
+    merged = []
+    for rect in rects:
+        if not rect or rect.width <= 0 or rect.height <= 0:
+            continue
+        rect = pygame.Rect(rect)
+        i = 0
+        while i < len(merged):
+            if rect.colliderect(merged[i].inflate(2, 2)):
+                rect.union_ip(merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+
+    screen = pygame.Rect((0, 0), config.resolution)
+    if sum(rect.width*rect.height for rect in merged) > full_ratio*screen.width*screen.height:
+        return [screen]
+    return [rect.clip(screen) for rect in merged]
 
 # Compare if between x_0,y_0 and x_1,y_1
 def clicked(click, start__pos, size):
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import logging
+import os
+import time
+
+# Monotonic clock in seconds. Not affected by NTP adjusting the wall clock
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    # Python 2: clock_gettime(CLOCK_MONOTONIC) from librt
+    import ctypes
+    import ctypes.util
+
+    class _timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    _CLOCK_MONOTONIC = 1
+
+    try:
+        _librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1", use_errno=True)
+        _clock_gettime = _librt.clock_gettime
+        _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+        def monotonic():
+            t = _timespec()
+            if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return t.tv_sec + t.tv_nsec * 1e-9
+    except (OSError, AttributeError):
+        monotonic = time.time
+
+class Scheduler(object):
+    """
+    Named one-shot and periodic tasks on a monotonic clock.
+
+    Scheduling a name that already exists replaces the old task. The main
+    loop sleeps for timeout() and then calls run_pending().
+    """
+    def __init__(self, clock=monotonic):
+        self.logger  = logging.getLogger("PiTFT-Playerui.scheduler")
+        self.clock   = clock
+        self.heap    = []
+        self.tasks   = {}
+        self.counter = itertools.count()
+
+    """ Run callback after delay seconds, then every period seconds if given """
+    def schedule(self, name, delay, callback=None, period=None):
+        self.cancel(name)
+        # deadline, sequence, name, callback, period, active
+        task = [self.clock() + delay, next(self.counter), name, callback, period, True]
+        self.tasks[name] = task
+        heapq.heappush(self.heap, task)
+
+        # Drop cancelled entries if they pile up
+        if len(self.heap) > 2*len(self.tasks) + 16:
+            self.heap = [task for task in self.heap if task[5]]
+            heapq.heapify(self.heap)
+
+    """ Periodic task, first run after one period """
+    def every(self, name, period, callback):
+        self.schedule(name, period, callback, period)
+
+    def cancel(self, name):
+        task = self.tasks.pop(name, None)
+        if task:
+            task[5] = False
+
+    """ True if the task has not run (or been cancelled) yet """
+    def pending(self, name):
+        return name in self.tasks
+
+    """ Seconds until the task is due, None if not scheduled """
+    def remaining(self, name):
+        if name in self.tasks:
+            return max(self.tasks[name][0] - self.clock(), 0.0)
+        return None
+
+    """ Seconds until the next task is due, at most limit """
+    def timeout(self, limit=None):
+        while self.heap and not self.heap[0][5]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return limit
+        timeout = max(self.heap[0][0] - self.clock(), 0.0)
+        if limit is not None:
+            timeout = min(timeout, limit)
+        return timeout
+
+    """ Run all tasks that are due """
+    def run_pending(self):
+        now = self.clock()
+        while self.heap and self.heap[0][0] <= now:
+            task = heapq.heappop(self.heap)
+            deadline, sequence, name, callback, period, active = task
+            if not active:
+                continue
+
+            if period:
+                # Skip missed periods instead of running them in a burst
+                task = [max(deadline + period, now), next(self.counter), name, callback, period, True]
+                self.tasks[name] = task
+                heapq.heappush(self.heap, task)
+            else:
+                del self.tasks[name]
+
+            if callback:
+                try:
+                    callback()
+                except Exception as e:
+                    self.logger.error("%s: %s" % (name, e))
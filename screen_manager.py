@@ -4,10 +4,17 @@ from pygame.locals import *
 import time
 import logging
 import os
+import functools
 from math import ceil, floor
+from threading import Lock
 
 import config
 from positioning import *
+from list_buffer import ListBuffer
+from scheduler import monotonic
+from cover_cache import cover_cache
+from cover_fetcher import cover_decoder
+from stats import RollingHistogram
 
 class ScreenManager:
     def __init__(self, path, pc):
@@ -22,6 +29,7 @@ class ScreenManager:
             self.font["details"]     = pygame.font.Font(config.fontfile, 16)
             self.font["elapsed"]     = pygame.font.Font(config.fontfile, 16)
             self.font["listview"]    = pygame.font.Font(config.fontfile, 20)
+            self.font["jumpletter"]  = pygame.font.Font(config.fontfile, 48)
         except Exception as e:
             self.logger.error(e)
             raise
@@ -84,6 +92,16 @@ class ScreenManager:
         self.status["update"]["volume"]    = True
         self.status["update"]["trackinfo"] = True
         self.status["update"]["coverart"]  = True
+        self.status["update"]["marquee"]   = False
+
+        # Track info lines too long to fit scroll as a marquee. Speed in pixels
+        # per second, pause at the start of each round in seconds
+        self.marquee         = {"artistalbum": None, "title": None} # Whole line rasterized once
+        self.marquee_offset  = {"artistalbum": 0,    "title": 0}    # Pixels scrolled
+        self.marquee_start   = 0.0
+        self.marquee_speed   = 30
+        self.marquee_pause   = 2.0
+        self.marquee_gap     = 40
 
         # Visual indicators when scrolling on sliders
         self.seekpos = -1.0
@@ -97,6 +115,20 @@ class ScreenManager:
         self.draw_offset        = 0,0
         self.list_offset        = 0
         self.listitems_on_screen = config.resolution[1]//size["listitem_height"]
+        self.list_overscan      = 1 # Extra rows rendered above and below the screen
+        self.jump_letter        = None # Letter shown while jumping with the scrollbar
+        self.list_requested     = False # List view opened while the player was busy
+        # Rows pre-rendered for scrolling: the screen plus one screen above and below
+        self.list_buffer        = ListBuffer(config.resolution[0] - pos("listview")[0], size["listitem_height"],
+                                             3*self.listitems_on_screen + 2*self.list_overscan + 2)
+
+        # Cover art not in the cover cache is decoded and scaled on the cover
+        # decode thread, apart from the downloads. The result waits in cover_decoded until the UI thread
+        # takes it; decode_times holds the time taken per cover, in seconds
+        self.cover_wanted       = None # (file, key) of the cover to show
+        self.cover_decoded      = None # (file, key, surface) done in the background
+        self.cover_lock         = Lock()
+        self.decode_times       = RollingHistogram(64)
 
         self.populate_players()
 
@@ -223,6 +255,15 @@ class ScreenManager:
             if self.status["track"]:
                 self.status["title"] = self.status["track"] + " - " + self.status["title"]
 
+            # Lines that don't fit beside the player logo scroll
+            for line in self.marquee:
+                if self.font["details"].size(self.status[line])[0] > size["trackinfo_text"]:
+                    self.marquee[line] = render_text(self.status[line], self.font["details"])
+                else:
+                    self.marquee[line] = None
+                self.marquee_offset[line] = 0
+            self.marquee_start = monotonic()
+
             # Time total
             try:
                 min = int(ceil(float(self.pc["song"]["time"])))/60
@@ -273,34 +314,152 @@ class ScreenManager:
             self.pc.update_ack("volume")
 
         if self.pc.updated("coverart"):
-            self.image["cover"] = self.fetch_coverart(self.pc["coverartfile"])
+            self.image["cover"] = self.fetch_coverart(self.pc["coverartfile"], self.pc["coverkey"])
 
             self.force_update("coverart")
             self.pc.update_ack("coverart")
 
-    def fetch_coverart(self, coverartfile):
+        # Cover decoded in the background
+        with self.cover_lock:
+            decoded, self.cover_decoded = self.cover_decoded, None
+        if decoded and decoded[:2] == self.cover_wanted:
+            self.image["cover"] = decoded[2]
+            self.force_update("coverart")
+
+        # List content built later because the player was busy
+        if self.pc.updated("listcontent"):
+            if self.list_requested or self.view == "listview":
+                self.list_requested = False
+                self.switch_view("listview")
+            self.pc.update_ack("listcontent")
+
+        # List content loaded or changed
+        if self.pc.updated("list"):
+            if self.view == "listview":
+                self.force_update("screen")
+            self.pc.update_ack("list")
+
+    """ Track info line at position: the whole text, or the visible part of the marquee. Return value: rect drawn """
+    def render_trackinfo_line(self, surface, line, position):
+        marquee = self.marquee[line]
+        if not marquee:
+            return surface.blit(render_text(self.status[line], self.font["details"]), position)
+
+        # Clipped blits from the rasterized line, wrapping around after a gap
+        width, height = size["trackinfo_text"], marquee.get_height()
+        offset = self.marquee_offset[line]
+        rect = surface.blit(marquee, position, (offset, 0, width, height))
+        wrap = marquee.get_width() + self.marquee_gap - offset
+        if wrap < width:
+            rect = rect.union(surface.blit(marquee, (position[0] + wrap, position[1]), (0, 0, width - wrap, height)))
+        return rect
+
+    """ True if track info is scrolling on screen """
+    def marquee_running(self):
+        return self.view == "main" and any(self.marquee.values())
+
+    """
+    Move the marquee to where it should be by now. Redraws only if it moved.
+    Return value: seconds until it moves next, None if not running
+    """
+    def marquee_step(self):
+        if not self.marquee_running():
+            return None
+
+        elapsed = monotonic() - self.marquee_start
+        delay = None
+        for line, marquee in self.marquee.items():
+            if not marquee:
+                continue
+            period = marquee.get_width() + self.marquee_gap
+            cycle = self.marquee_pause + float(period)/self.marquee_speed
+            position = elapsed % cycle - self.marquee_pause
+
+            # Rounds start with a pause
+            if position < 0:
+                offset = 0
+                line_delay = -position
+            else:
+                offset = int(position*self.marquee_speed)
+                line_delay = 1.0/self.marquee_speed
+
+            if offset != self.marquee_offset[line]:
+                self.marquee_offset[line] = offset
+                self.force_update("marquee")
+            delay = line_delay if delay is None else min(delay, line_delay)
+        return delay
+
+    """
+    Cover art to show now. Cached covers are read right away. Others are
+    decoded in the background and the placeholder is shown meanwhile
+    """
+    def fetch_coverart(self, coverartfile, coverkey=""):
+        self.cover_wanted = (coverartfile, coverkey)
+        coverart = cover_cache.get(coverkey)
+        if coverart:
+            self.logger.debug("Using cached coverart: %s" % coverkey)
+            cover_decoder.cancel(self)
+            return coverart.convert()
         if coverartfile:
-            try:
-                self.logger.debug("Using coverart: %s" % coverartfile)
-                coverart = pygame.image.load(coverartfile)
-                return pygame.transform.scale(coverart, size["coverart"])
-            except Exception as e:
-                self.logger.error(e)
-                return self.image["coverart_place"]
+            self.logger.debug("Decoding coverart: %s" % coverartfile)
+            cover_decoder.submit(self, (coverartfile, coverkey),
+                                 functools.partial(self.decode_coverart, coverartfile, coverkey),
+                                 self._coverart_decoded)
         else:
-            return self.image["coverart_place"]
+            cover_decoder.cancel(self)
+        return self.image["coverart_place"]
 
+    """ Cover decode thread: load, scale, cache and convert to the display format """
+    def decode_coverart(self, coverartfile, coverkey):
+        start = monotonic()
+        try:
+            coverart = cover_cache.load(coverkey, coverartfile).convert()
+        except Exception as e:
+            self.logger.error(e)
+            coverart = self.image["coverart_place"]
+        return coverart, monotonic() - start
+
+    """ Cover decode thread: hand the decoded cover over to the UI thread """
+    def _coverart_decoded(self, key, result):
+        coverart, seconds = result
+        with self.cover_lock:
+            self.decode_times.add(seconds)
+            self.cover_decoded = key + (coverart,)
+        self.pc.wakeup()
+
+    """ True if a cover decoded in the background waits to be shown """
+    def coverart_decoded(self):
+        return self.cover_decoded is not None
+
+    def decode_stats(self):
+        with self.cover_lock:
+            summary = self.decode_times.summary()
+        return "%d covers, p50 %.0f ms, max %.0f ms" % (summary["count"], 1000*summary["p50"], 1000*summary["max"])
+
+    """ Return value: list of screen areas drawn, empty if nothing changed """
     def render(self, surface):
+        if not self.dirty():
+            return []
+
+        rects = []
         if self.updated("screen"):
-            surface.blit(self.image["background"], (0,0))
+            rects.append(surface.blit(self.image["background"], (0,0)))
         try:
             if self.view == "main":
-                self.render_mainscreen(surface)
+                rects += self.render_mainscreen(surface)
             elif self.view == "listview":
-                self.render_listview(surface)
+                rects += self.render_listview(surface)
         except Exception as e:
             self.logger.error(e)
-            pass
+            # Partial frame: refresh it all
+            rects.append(surface.get_rect())
+        return merge_rects(rects)
+
+    """ True if the current view has something to draw """
+    def dirty(self):
+        if self.view == "listview":
+            return self.updated("screen")
+        return self.updated()
 
     def click(self, mousebutton, clickpos):
         try:
@@ -336,12 +495,19 @@ class ScreenManager:
     def switch_view(self, view):
         if view == "main":
             self.view=view
+            self.list_requested = False
         elif view == "listview":
+            # Scroll back to where the list was left
+            if self.pc["list"].get("offset") is not None:
+                max_offset = size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-self.listitems_on_screen)
+                self.list_offset = limit_offset((0,self.pc["list"]["offset"]),(0, 0, 0, max(max_offset, 0)))[1]
             # Center currently playing item
-            self.list_offset = (self.pc["list"]["position"]-self.listitems_on_screen/2)*size['listitem_height']
-            self.list_offset = limit_offset((0,self.list_offset),(0, 0, 0, size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-self.listitems_on_screen-1)))[1]
+            else:
+                self.list_offset = (self.pc["list"]["position"]-self.listitems_on_screen/2)*size['listitem_height']
+                self.list_offset = limit_offset((0,self.list_offset),(0, 0, 0, size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-self.listitems_on_screen-1)))[1]
             if self.pc["list"]["viewcontent"] and self.pc["list"]["click"]:
                 self.view=view
+                self.list_buffer.invalidate()
         else:
             self.logger.debug("Unknown view %s" % view)
         self.force_update()
@@ -350,7 +516,9 @@ class ScreenManager:
         self.pc.control_player("switch", id)
         self.force_update()
 
+    """ Return value: list of rects drawn """
     def render_mainscreen(self,surface):
+        rects = []
         if self.updated("screen"):
             # Update everything
             self.force_update()
@@ -360,111 +528,126 @@ class ScreenManager:
                 color = "text" if self.draw_offset[1] == -(index+1)*size["bottommenu"] else "inactive"
                 text = render_text(item["name"], self.font["menuitem"], color)
                 text_rect = text.get_rect(center=(config.resolution[0]/2, 0))
-                surface.blit(text,
-                            menupos("bottommenu", index, (text_rect[0],self.draw_offset[1])))
+                rects.append(surface.blit(text,
+                            menupos("bottommenu", index, (text_rect[0],self.draw_offset[1]))))
             # Top menu
             for i in range (0,len(self.topmenu)-1):
                 index = i if i < self.pc.get_current() else i+1
                 color = "text" if self.draw_offset[1] == (i+1)*size["topmenu"] else "inactive"
                 text = render_text(self.topmenu[index]("name").upper(), self.font["menuitem"], color)
                 text_rect = text.get_rect(center=(config.resolution[0]/2, 0))
-                surface.blit(text,
-                            menupos("topmenu", i, (text_rect[0],self.draw_offset[1]), "up"))
+                rects.append(surface.blit(text,
+                            menupos("topmenu", i, (text_rect[0],self.draw_offset[1]), "up")))
             self.update_ack("screen")
 
         # Track info
         if self.updated("trackinfo"):
             # Refresh backgrounds
-            surface.blit(self.image["background"],
+            rects.append(surface.blit(self.image["background"],
                         pos("trackinfobackground",(0, self.draw_offset[1])),
                         (pos("trackinfobackground",(0, self.draw_offset[1])),
-                        size["trackinfobackground"]))
-            surface.blit(self.image["progress_bg"],
-                        pos("progressbar", (0, self.draw_offset[1])))
+                        size["trackinfobackground"])))
+            rects.append(surface.blit(self.image["progress_bg"],
+                        pos("progressbar", (0, self.draw_offset[1]))))
 
             # Artist - Album (date)
-            surface.blit(render_text(self.status["artistalbum"], self.font["details"]),
-                        pos("album", (0, self.draw_offset[1])))
+            rects.append(self.render_trackinfo_line(surface, "artistalbum", pos("album", (0, self.draw_offset[1]))))
 
             # Track number - title
-            surface.blit(render_text(self.status["title"], self.font["details"]),
-                        pos("track", (0, self.draw_offset[1])))
+            rects.append(self.render_trackinfo_line(surface, "title", pos("track", (0, self.draw_offset[1]))))
 
             # Total time
             if self.status["timeElapsed"] and self.status["timeTotal"]:
 
-                surface.blit(render_text(self.status["timeTotal"], self.font["elapsed"]),
-                            pos("track_length", (0, self.draw_offset[1])))
+                rects.append(surface.blit(render_text(self.status["timeTotal"], self.font["elapsed"]),
+                            pos("track_length", (0, self.draw_offset[1]))))
 
             # Draw player logo if it exists
             logo = self.pc("logo")
             if logo:
-                surface.blit(self.image["background"],
+                rects.append(surface.blit(self.image["background"],
                              pos("logoback",(0, self.draw_offset[1])),
                             (pos("logoback",(0, self.draw_offset[1])),
-                            size["logoback"]))
-                surface.blit(logo, pos("logo",(0, self.draw_offset[1])))
+                            size["logoback"])))
+                rects.append(surface.blit(logo, pos("logo",(0, self.draw_offset[1]))))
 
             self.update_ack("trackinfo")
+            self.update_ack("marquee")
+
+        # Marquee step: only the scrolling lines
+        if self.updated("marquee"):
+            for line, position in (("artistalbum", "album"), ("title", "track")):
+                if self.marquee[line]:
+                    line_rect = pygame.Rect(pos(position, (0, self.draw_offset[1])),
+                                            (size["trackinfo_text"], self.marquee[line].get_height()))
+                    surface.blit(self.image["background"], line_rect, line_rect)
+                    rects.append(line_rect.union(self.render_trackinfo_line(surface, line, line_rect.topleft)))
+            self.update_ack("marquee")
 
         # Time Elapsed
-        if self.updated("elapsed") and self.pc("elapsed_enabled"):
-
-            # Refresh backgrounds
-            surface.blit(self.image["background"],
-                         pos("progressbackground",(0, self.draw_offset[1])),
-                        (pos("progressbackground",(0, self.draw_offset[1])), size["progressbackground"]))
-            surface.blit(self.image["progress_bg"],
-                         pos("progressbar", (0, self.draw_offset[1])))
-
-            # Progress bar
-            if self.seekpos == -1:
-                progress = self.status["timeElapsedPercentage"]
-            else:
-                progress = self.seekpos
-            surface.blit(self.image["progress_fg"],
-                        pos("progressbar", (0, self.draw_offset[1])),
-                        (0,0,int(size["progressbar"][0]*progress),10))
-            # Text
-            surface.blit(render_text(self.status["timeElapsed"], self.font["elapsed"]),
-                        pos("elapsed", (0, self.draw_offset[1])))
+        if self.updated("elapsed"):
+            if self.pc("elapsed_enabled"):
+                # Refresh backgrounds
+                rects.append(surface.blit(self.image["background"],
+                             pos("progressbackground",(0, self.draw_offset[1])),
+                            (pos("progressbackground",(0, self.draw_offset[1])), size["progressbackground"])))
+                rects.append(surface.blit(self.image["progress_bg"],
+                             pos("progressbar", (0, self.draw_offset[1]))))
+
+                # Progress bar
+                if self.seekpos == -1:
+                    progress = self.status["timeElapsedPercentage"]
+                else:
+                    progress = self.seekpos
+                rects.append(surface.blit(self.image["progress_fg"],
+                            pos("progressbar", (0, self.draw_offset[1])),
+                            (0,0,int(size["progressbar"][0]*progress),10)))
+                # Text
+                rects.append(surface.blit(render_text(self.status["timeElapsed"], self.font["elapsed"]),
+                            pos("elapsed", (0, self.draw_offset[1]))))
 
             self.update_ack("elapsed")
 
         # Buttons
-        if self.updated("repeat") and self.pc("repeat_enabled"):
-            surface.blit(self.image["button_repeat"],
-                        pos("repeatbutton", (self.draw_offset)))
+        if self.updated("repeat"):
+            if self.pc("repeat_enabled"):
+                rects.append(surface.blit(self.image["button_repeat"],
+                            pos("repeatbutton", (self.draw_offset))))
             self.update_ack("repeat")
 
-        if self.updated("random") and self.pc("random_enabled"):
-            surface.blit(self.image["button_random"],
-                        pos("randombutton", (self.draw_offset)))
+        if self.updated("random"):
+            if self.pc("random_enabled"):
+                rects.append(surface.blit(self.image["button_random"],
+                            pos("randombutton", (self.draw_offset))))
             self.update_ack("random")
 
         #Volume
-        if config.volume_enabled and self.updated("volume") and self.pc("volume_enabled"):
-            surface.blit(self.image["volume_bg"],
-                        pos("volume", (self.draw_offset)))
-            # Slider
-            pos_volumefg = pos("volume_slider", (self.draw_offset))
-            if self.volumepos == -1:
-                volumefg_scale = (self.status["volume"]*(size["volume_slider"][1])/100)
-            else:
-                volumefg_scale = (self.volumepos * (size["volume_slider"][1])/100)
+        if self.updated("volume"):
+            if config.volume_enabled and self.pc("volume_enabled"):
+                rects.append(surface.blit(self.image["volume_bg"],
+                            pos("volume", (self.draw_offset))))
+                # Slider
+                pos_volumefg = pos("volume_slider", (self.draw_offset))
+                if self.volumepos == -1:
+                    volumefg_scale = (self.status["volume"]*(size["volume_slider"][1])/100)
+                else:
+                    volumefg_scale = (self.volumepos * (size["volume_slider"][1])/100)
 
-            pos_volumefg = (pos_volumefg[0], pos_volumefg[1]+size["volume_slider"][1]-volumefg_scale)
-            surface.blit(self.image["volume_fg"],
-                        (pos_volumefg))
+                pos_volumefg = (pos_volumefg[0], pos_volumefg[1]+size["volume_slider"][1]-volumefg_scale)
+                rects.append(surface.blit(self.image["volume_fg"],
+                            (pos_volumefg)))
             self.update_ack("volume")
 
-        # Cover art
-        if self.updated("coverart"):
-            surface.blit(self.image["cover"],
-                        pos("coverart", self.draw_offset))
-            surface.blit(self.image["coverart_border"],
-                        pos("coverart", self.draw_offset))
+        # Cover art, playback state is shown on the border
+        if self.updated("coverart") or self.updated("state"):
+            rects.append(surface.blit(self.image["cover"],
+                        pos("coverart", self.draw_offset)))
+            rects.append(surface.blit(self.image["coverart_border"],
+                        pos("coverart", self.draw_offset)))
             self.update_ack("coverart")
+            self.update_ack("state")
+
+        return rects
 
     def click_mainscreen(self, mousebutton, clickpos):
 
@@ -579,9 +762,11 @@ class ScreenManager:
 
                     # Only menu item type for now is a list, but more might come
                     if self.pc["menu"][i]["type"] == "listview":
-                        # Get list content from player
-                        self.pc["menu"][i]['listcontent']()
-                        self.switch_view("listview")
+                        # Get list content from player. A busy player builds it later
+                        if self.pc["menu"][i]['listcontent']() is False:
+                            self.list_requested = True
+                        else:
+                            self.switch_view("listview")
 
                 # Reset offset
                 self.draw_offset = (0,0)
@@ -592,7 +777,9 @@ class ScreenManager:
                     self.image["coverart_border"] = self.image["coverart_border_paused"]
         return allow_smoothscroll
 
+    """ Return value: list of rects drawn """
     def render_listview(self,surface):
+        rects = []
 
         list_draw_offset = self.list_offset%size['listitem_height']
         # Detect scrolling:
@@ -604,61 +791,109 @@ class ScreenManager:
             scrolled_item = -1
             
 
-        # List content
+        # List content: only the rows intersecting the screen plus overscan
         if self.pc["list"]["viewcontent"]:
-            list_length = len(self.pc["list"]["viewcontent"])
-            for i in range(-10*self.listitems_on_screen,11*self.listitems_on_screen):
-                list_index = i+self.list_offset//size['listitem_height']
-                if list_index in range(0, list_length):
-                    try:
-                        listitem = self.pc["list"]["viewcontent"][list_index].decode('utf-8')
-
-                    except Exception as e:
-                        listitem = ""
-                        self.logger.error(e)
-
-                    # Highlight currently playing item
-                    if list_index == self.pc["list"]["highlight"]:
-                        text = render_text(listitem, self.font["listview"], "highlight")
-                    else:
-                        text = render_text(listitem, self.font["listview"], "text")
+            viewcontent = self.pc["list"]["viewcontent"]
+            list_length = len(viewcontent)
+            item_height = size['listitem_height']
+            first_item = self.list_offset//item_height
+
+            # Row i is drawn at row_top + i*item_height
+            row_top = pos("listview")[1] + self.draw_offset[1] - list_draw_offset
+            first_row = -(row_top + item_height)//item_height - self.list_overscan
+            last_row = (config.resolution[1] - row_top)//item_height + self.list_overscan
+            first_index = max(first_item + first_row, 0)
+            last_index = min(first_item + last_row, list_length - 1)
+
+            # Vertical scrolling: one blit from the pre-rendered rows
+            if self.draw_offset[0] == 0 and first_index <= last_index:
+                self.list_buffer.fill(viewcontent, self.pc["list"]["highlight"],
+                                      first_index, last_index, self.render_listitem)
+                rects.append(self.list_buffer.blit(surface, pos("listview", (0, self.draw_offset[1]-list_draw_offset+item_height*(first_index-first_item))),
+                                                   first_index, last_index))
+
+            # Horizontal swipe: rows move separately
+            else:
+                for list_index in xrange(first_index, last_index + 1):
+                    i = list_index - first_item
+                    text = self.render_listitem(list_index)
 
                     # Scroll all left (close), only item right (menu function)
                     if list_index != scrolled_item and self.draw_offset[0] > 0:
-                        surface.blit(text, pos("listview", (0,self.draw_offset[1]-list_draw_offset+size['listitem_height']*i)))
+                        rects.append(surface.blit(text, pos("listview", (0,self.draw_offset[1]-list_draw_offset+item_height*i))))
                     else:
-                        surface.blit(text, pos("listview", (self.draw_offset[0],self.draw_offset[1]-list_draw_offset+size['listitem_height']*i)))
-
-                    # List button icons
-                    for index, item in enumerate(self.pc["list"]["buttons"]):
-                        if self.draw_offset[0] == self.list_scroll_threshold*(index+1):
-                            surface.blit(item["icon"],pos("listview", (12, size['listitem_height']*scrolled_item-self.list_offset)))
+                        rects.append(surface.blit(text, pos("listview", (self.draw_offset[0],self.draw_offset[1]-list_draw_offset+item_height*i))))
 
+            # List button icons
+            for index, item in enumerate(self.pc["list"]["buttons"]):
+                if self.draw_offset[0] == self.list_scroll_threshold*(index+1):
+                    rects.append(surface.blit(item["icon"],pos("listview", (12, item_height*scrolled_item-self.list_offset))))
 
             # Scrollbar
             if list_length > self.listitems_on_screen:
-                surface.blit(self.image["scroll_bg"],
-                             pos("scrollbar", (0, 0)))
+                rects.append(surface.blit(self.image["scroll_bg"],
+                             pos("scrollbar", (0, 0))))
 
                 pos_scrollfg = pos("scrollbar_slider")
                 scroll_ratio = float(self.list_offset - self.draw_offset[1])
-                scroll_ratio = scroll_ratio/float((len(self.pc["list"]["viewcontent"])-self.listitems_on_screen)*size["listitem_height"])
+                # Sorted: in the slot of the letter on top, as jumped to
+                if self.pc["list"].get("jump"):
+                    scroll_ratio = self.pc["list"]["jump"].fraction_at(scroll_ratio/size["listitem_height"])
+                else:
+                    scroll_ratio = scroll_ratio/float((len(self.pc["list"]["viewcontent"])-self.listitems_on_screen)*size["listitem_height"])
                 scroll_ratio = 1.0 if scroll_ratio > 1.0 else scroll_ratio
                 scroll_ratio = 0.0 if scroll_ratio < 0.0 else scroll_ratio
                 scrollfg_scale = scroll_ratio*float(size["scrollbar_slider"][1])
                 pos_scrollfg = (pos_scrollfg[0], pos_scrollfg[1]+scrollfg_scale)
-                surface.blit(self.image["scroll_fg"],
-                            (pos_scrollfg))
+                rects.append(surface.blit(self.image["scroll_fg"],
+                            (pos_scrollfg)))
+
+            # Letter jumped to with the scrollbar
+            if self.jump_letter:
+                letter_rect = pygame.Rect(pos("jumpletter"), size["jumpletter"])
+                rects.append(surface.fill(color["overlay"], letter_rect))
+                text = render_text(self.jump_letter, self.font["jumpletter"])
+                rects.append(surface.blit(text, text.get_rect(center=letter_rect.center)))
+            self.update_ack("screen")
         else:
             self.switch_view("main")
 
+        return rects
+
+    """ Scroll to the first item of the letter at scrollbar position y """
+    def jump_to_letter(self, y):
+        fraction = float(y - pos("scrollbar_slider")[1])/size["scrollbar_slider"][1]
+        self.jump_letter, index = self.pc["list"]["jump"].at_fraction(fraction)
+        max_offset = size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-self.listitems_on_screen)
+        self.list_offset = limit_offset((0,index*size["listitem_height"]),(0, 0, 0, max(max_offset, 0)))[1]
+
+    """ Return value: text surface of list item at index """
+    def render_listitem(self, list_index):
+        try:
+            listitem = self.pc["list"]["viewcontent"][list_index].decode('utf-8')
+            listitem = fit_text(listitem, self.font["listview"], size["listitem_text"])
+
+        except Exception as e:
+            listitem = ""
+            self.logger.error(e)
+
+        # Highlight currently playing item
+        if list_index == self.pc["list"]["highlight"]:
+            return render_text(listitem, self.font["listview"], "highlight")
+        else:
+            return render_text(listitem, self.font["listview"], "text")
+
     def click_listview(self, mousebutton, clickpos):
 
         if clicked(clickpos, pos("scrollbar_click"), size["scrollbar_click"]):
-            ratio = float(-32.0 + clickpos[1])*1.20
-            ratio = ratio/float(config.resolution[1])
-            self.list_offset = int(ratio*size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-1))
-            self.list_offset = limit_offset((0,self.list_offset),(0, 0, 0, size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-self.listitems_on_screen-1)))[1]
+            if self.pc["list"].get("jump"):
+                self.jump_to_letter(clickpos[1])
+                self.jump_letter = None
+            else:
+                ratio = float(-32.0 + clickpos[1])*1.20
+                ratio = ratio/float(config.resolution[1])
+                self.list_offset = int(ratio*size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-1))
+                self.list_offset = limit_offset((0,self.list_offset),(0, 0, 0, size["listitem_height"]*(len(self.pc["list"]["viewcontent"])-self.listitems_on_screen-1)))[1]
 
         # Normal click
         elif clicked(clickpos, (0,0), config.resolution):
@@ -668,6 +903,9 @@ class ScreenManager:
             if click_index > len(self.pc["list"]["viewcontent"])-1:
                 click_index = -1
 
+            # Let the player remember the position of the list it leaves
+            self.pc.set_list_offset(self.list_offset)
+
             # Check return value: True if staying in list view with new content
             next_view = self.pc["list"]["click"](click_index, mousebutton)
             if next_view == "listview":
@@ -689,12 +927,15 @@ class ScreenManager:
         else:
             max_offset = 0
 
-        # Scrollbar: fast scroll
+        # Scrollbar: jump by letter if the list is sorted, else fast scroll
         if clicked(start, pos("scrollbar_click"), size["scrollbar_click"]):
-            ratio = float(-32.0 + start[1] + y)*1.20
-            ratio = ratio/float(config.resolution[1])
-            self.list_offset = int(ratio*size["listitem_height"]*(len(self.pc["list"]["viewcontent"])))
-            self.list_offset = limit_offset((0,self.list_offset),(0, 0, 0, max_offset))[1]
+            if self.pc["list"].get("jump"):
+                self.jump_to_letter(start[1] + y)
+            else:
+                ratio = float(-32.0 + start[1] + y)*1.20
+                ratio = ratio/float(config.resolution[1])
+                self.list_offset = int(ratio*size["listitem_height"]*(len(self.pc["list"]["viewcontent"])))
+                self.list_offset = limit_offset((0,self.list_offset),(0, 0, 0, max_offset))[1]
 
         # Normal scroll
         else:
@@ -712,6 +953,7 @@ class ScreenManager:
         # Scroll ended
         if end:
             self.scroll_start = -1,-1
+            self.jump_letter = None
             self.list_offset = self.list_offset - self.draw_offset[1]
             self.list_offset = limit_offset((0,self.list_offset),(0, 0, 0, max_offset))[1]
             self.draw_offset = (0,0)
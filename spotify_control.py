@@ -1,12 +1,108 @@
 # -*- coding: utf-8 -*-
 import json
-import subprocess
+import logging
+import socket
+import functools
 import httplib, urllib
-from threading import Thread
 
-from player_base import PlayerBase
+from player_base import PlayerBase, queued
+from scheduler import monotonic
+from cover_cache import cover_key
+from downloader import downloader
 #import config
 
+class SpotifySession(object):
+    """
+    Keep-alive HTTP/1.1 connection to spotify-connect-web with connect and
+    read timeouts. If the server has closed a reused connection, shown by a
+    failed send or an empty status line, the socket is reopened and the
+    request sent again once. Requests that may have reached the server,
+    e.g. timed out waiting for the response, are never sent again.
+    """
+    def __init__(self, host, port, connect_timeout=2.0, read_timeout=5.0):
+        self.logger          = logging.getLogger("PiTFT-Playerui.spotify.session")
+        self.host            = host
+        self.port            = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout    = read_timeout
+        self.connection      = None
+
+        # Latency per path: count, total and max seconds. Logged every stats_interval requests
+        self.stats          = {}
+        self.requests       = 0
+        self.stats_interval = 100
+
+    def connect(self):
+        self.close()
+        connection = httplib.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        # Headers and body go out in separate writes: don't let Nagle delay them
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connection = connection
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+
+    def request(self, method, path, body=None, headers={}):
+        headers = dict(headers)
+        headers["Connection"] = "keep-alive"
+
+        reused = self.connection is not None
+        while True:
+            if not self.connection:
+                self.connect()
+            start = monotonic()
+            try:
+                self.connection.request(method, path, body, headers)
+            except (httplib.HTTPException, socket.error) as e:
+                self.close()
+                # Not sent: retry if the server dropped a kept-alive connection
+                if not reused:
+                    raise
+                self.logger.debug("Reconnecting: %s" % e)
+                reused = False
+                continue
+
+            try:
+                response = self.connection.getresponse()
+                doc = response.read()
+                break
+            except httplib.BadStatusLine as e:
+                self.close()
+                # Closed by the server before it read the request
+                if not reused:
+                    raise
+                self.logger.debug("Reconnecting: %s" % repr(e))
+                reused = False
+            except (httplib.HTTPException, socket.error):
+                self.close()
+                raise
+
+        # Server doesn't keep the connection open
+        if response.will_close:
+            self.close()
+
+        self._record(path, monotonic() - start)
+        return doc
+
+    """ Send requests, (method, path) tuples, back to back on the same socket """
+    def batch(self, requests):
+        return [self.request(method, path) for method, path in requests]
+
+    def _record(self, path, latency):
+        stats = self.stats.setdefault(path, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += latency
+        stats[2] = max(stats[2], latency)
+
+        self.requests += 1
+        if self.requests % self.stats_interval == 0 and self.logger.isEnabledFor(logging.DEBUG):
+            for path, (count, total, worst) in sorted(self.stats.items()):
+                self.logger.debug("%s: %d requests, avg %.1f ms, max %.1f ms" % (path, count, 1000*total/count, 1000*worst))
+
 class SpotifyControl (PlayerBase):
     def __init__(self, config):
         super(SpotifyControl, self).__init__("spotify", config)
@@ -28,12 +124,6 @@ class SpotifyControl (PlayerBase):
 
         self.connect()
 
-    def __getitem__(self, item):
-        return self.data[item]
-
-    def __call__(self, item):
-        return self.capabilities[item]
-
     def refresh(self, active=False):
         status = {}
         song = {}
@@ -42,8 +132,11 @@ class SpotifyControl (PlayerBase):
             self.connect()
         else:
             try:
-                # Fetch status
-                sp_status = self._api("info","status")
+                # Fetch status, and song info right after it on the same connection
+                if active:
+                    sp_status, sp_metadata = self._api_batch(("info","status"), ("info","metadata"))
+                else:
+                    sp_status = self._api("info","status")
 
                 # Selected player in spotify
                 active_client = sp_status["active"]
@@ -79,12 +172,11 @@ class SpotifyControl (PlayerBase):
                 if not self.noConnection:
                     self.logger.error(e)
                 self._disconnected()
+                return
 
             try:
                 if active:
-                    # Fetch song info
-                    sp_metadata       = self._api("info","metadata")
-
+                    # Parse song info
                     self.volume = str(int(sp_metadata["volume"])*100/65535)
                     song["album"]     = sp_metadata["album_name"].encode('utf-8')
                     song["artist"]    = sp_metadata["artist_name"].encode('utf-8')
@@ -97,19 +189,8 @@ class SpotifyControl (PlayerBase):
                     # Fetch coverart
                     if song["cover_uri"] and not self.data["cover"] or song["cover_uri"] != self.data["song"]["cover_uri"]:
                         self.logger.debug("Spotify coverart changed, fetching...")
-                        self.data["cover"] = False
-
-                        # Find cover art on different thread
-                        try:
-                            if self.coverartThread:
-                                if not self.coverartThread.is_alive():
-                                    self.coverartThread = Thread(target=self._fetch_coverart(song["cover_uri"]))
-                                    self.coverartThread.start()
-                            else:
-                                self.coverartThread = Thread(target=self._fetch_coverart(song["cover_uri"]))
-                                self.coverartThread.start()
-                        except Exception as e:
-                            self.logger.error("Coverartthread: %s" % e)
+                        key = cover_key(song["cover_uri"])
+                        self.request_coverart(key, functools.partial(self._fetch_coverart, song["cover_uri"], key))
                     else:
                         song["coverartfile"] = self.data["coverartfile"]
                         song["cover"] = self.data["cover"]
@@ -136,9 +217,9 @@ class SpotifyControl (PlayerBase):
         if not self.noConnection:
             self.logger.info("Trying to connect to Spotify server")
 
-        self.client = httplib.HTTPConnection(self.config.spotify_host, self.config.spotify_port)
+        self.client = SpotifySession(self.config.spotify_host, self.config.spotify_port)
         try:
-            displayname = self._api("info","display_name")
+            self.client.connect()
             self.logger.info("Spotify connected")
             self.noConnection = False
             self.capabilities["connected"]   = True
@@ -154,9 +235,12 @@ class SpotifyControl (PlayerBase):
             self.logger.info("Lost connection to Spotify server")
         self.capabilities["connected"] = False
         self.init_data()
+        if self.client:
+            self.client.close()
         self.client = None
         self.noConnection = True
 
+    @queued
     def control(self, command, parameter=-1):
         # Translate commands
         if command == "stop":
@@ -186,21 +270,20 @@ class SpotifyControl (PlayerBase):
                 self.logger.error(e)
                 self._disconnected()
 
-    def _fetch_coverart(self, cover_uri):
-        self.data["cover"] = False
-        self.data["coverartfile"] = ""
+    """ Cover worker thread. Return value: downloaded cover art file, "" if failed """
+    def _fetch_coverart(self, cover_uri, key):
         try:
             if self.client:
                 coverart_url = self.config.spotify_host + ":" + self.config.spotify_port + "/api/info/image_url/" + cover_uri
                 if coverart_url:
-                    self.data["coverartfile"] = self.config.logpath + "/sp_cover.png"
-                    subprocess.check_output("wget -q %s -O %s" % (coverart_url, self.data["coverartfile"]), shell=True )
+                    coverartfile = self.coverart_download_file(key)
+                    downloader.get(coverart_url, coverartfile)
                     self.logger.debug("Spotify coverart downloaded")
-                    self.data["cover"] = True
-                    self.data["update"]["coverart"] = True
+                    return coverartfile
         except Exception as e:
             self.logger.error(e)
             pass
+        return ""
 
     # Using api from spotify-connect-web
     # Valid methods:  playback, info
@@ -208,13 +291,19 @@ class SpotifyControl (PlayerBase):
     # Valid playback commands: play, pause, prev, next, shuffle[/enable|disable], repeat[/enable|disable], volume
     def _api(self, method, command, parameter=0):
         if command != "volume":
-            self.client.request('GET', '/api/'+method+'/'+command, '{}')
+            doc = self.client.request('GET', '/api/'+method+'/'+command, '{}')
         else:
             params = urllib.urlencode({"value": parameter})
             headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
-            self.client.request('POST', '/api/'+method+'/'+command, params, headers)
+            doc = self.client.request('POST', '/api/'+method+'/'+command, params, headers)
+        return self._parse(doc)
+
+    # Several info requests back to back. Arguments: (method, command) tuples
+    def _api_batch(self, *requests):
+        docs = self.client.batch([('GET', '/api/'+method+'/'+command) for method, command in requests])
+        return [self._parse(doc) for doc in docs]
 
-        doc = self.client.getresponse().read()
+    def _parse(self, doc):
         try:
             doc = json.loads(doc)
         except:
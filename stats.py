@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from array import array
+
+class RollingHistogram(object):
+    """
+    Distribution of the last size samples, kept in a fixed ring buffer.
+    Adding is O(1); sorting happens only when percentiles are asked for.
+    """
+    def __init__(self, size=1024):
+        self.size    = size
+        self.samples = array("d", [0.0]*size)
+        self.index   = 0
+        self.count   = 0
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count += 1
+
+    """ Return value: dict with sample count, p50, p95, p99 and max of the window """
+    def summary(self):
+        window = sorted(self.samples[:min(self.count, self.size)])
+        if not window:
+            return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        def percentile(p):
+            return window[min(int(p*len(window)), len(window)-1)]
+
+        return {"count": self.count,
+                "p50"  : percentile(0.50),
+                "p95"  : percentile(0.95),
+                "p99"  : percentile(0.99),
+                "max"  : window[-1]}
+
+class PhaseStats(object):
+    """ Rolling histograms of durations per named phase, in seconds """
+    def __init__(self, phases, size=1024):
+        self.phases = list(phases)
+        self.histograms = dict((phase, RollingHistogram(size)) for phase in self.phases)
+
+    def add(self, phase, duration):
+        if phase not in self.histograms:
+            self.phases.append(phase)
+            self.histograms[phase] = RollingHistogram(self.histograms[self.phases[0]].size)
+        self.histograms[phase].add(duration)
+
+    def report(self):
+        lines = ["%-16s %8s %9s %9s %9s %9s" % ("phase", "count", "p50 ms", "p95 ms", "p99 ms", "max ms")]
+        for phase in self.phases:
+            summary = self.histograms[phase].summary()
+            lines.append("%-16s %8d %9.2f %9.2f %9.2f %9.2f" % (phase, summary["count"],
+                         1000*summary["p50"], 1000*summary["p95"], 1000*summary["p99"], 1000*summary["max"]))
+        return "\n".join(lines)
+
+    """ Write the report to filename, replacing the previous one """
+    def dump(self, filename, header=""):
+        tmpfile = filename + ".tmp"
+        with open(tmpfile, "w") as f:
+            f.write(time.strftime("%Y-%m-%d %H:%M:%S") + "\n")
+            if header:
+                f.write(header + "\n")
+            f.write(self.report() + "\n")
+        os.rename(tmpfile, filename)
@@ -4,18 +4,24 @@ import sys, pygame
 from pygame.locals import *
 import time
 import os
+import errno
+import select
 import subprocess
 import logging
-import datetime
 from math import ceil, floor
-from datetime import timedelta
-from signal import alarm, signal, SIGALRM, SIGTERM, SIGKILL
+from signal import alarm, signal, SIGALRM, SIGTERM, SIGKILL, SIGUSR1
 from logging.handlers import TimedRotatingFileHandler
 from daemon import Daemon
 
 # Own modules
 from control import PlayerControl
 from screen_manager import ScreenManager
+from positioning import text_cache
+from cover_cache import cover_cache
+from cover_fetcher import cover_fetcher
+from downloader import downloader
+from scheduler import Scheduler, monotonic
+from stats import PhaseStats
 import config
 
 # Additional modules, if in config
@@ -118,11 +124,23 @@ class PitftDaemon(Daemon):
                 logger.error(e)
                 self.lirc_enabled = False
 
-        # Mouse variables
-        self.clicktime          = datetime.datetime.now()
-        self.longpress_time     = timedelta(milliseconds=300)
-        self.click_filtertime   = datetime.datetime.now()
-        self.click_filterdelta  = timedelta(milliseconds=10)
+        # Touchscreen device for the event wait. Only used for readiness,
+        # SDL keeps reading its own handle
+        self.touch_fd = None
+        try:
+            self.touch_fd = os.open(os.environ["SDL_MOUSEDEV"], os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as e:
+            logger.debug("Touchscreen not available for waiting: %s" % e)
+
+        # Longest wait if input can't be waited on (e.g. X window), seconds
+        self.input_polltime = 0.01
+
+        # Timers
+        self.scheduler = Scheduler()
+
+        # Mouse variables. Times in seconds
+        self.longpress_time     = 0.3
+        self.click_filterdelta  = 0.01
         self.scroll_threshold   = (20, 20)
         self.start_pos          = 0,0
         self.mouse_scroll       = ""
@@ -136,15 +154,33 @@ class PitftDaemon(Daemon):
         self.smoothscroll_direction_samples = 10
         self.smoothscroll_directions = [0]*self.smoothscroll_direction_samples
         self.smoothscroll_factor    = 0.9
-        self.smoothscroll_timedelta = timedelta(milliseconds=1)
-        self.smoothscroll_time      = datetime.datetime.now()
+        self.smoothscroll_interval = 0.01
+
+        # Times in seconds
+        self.screen_refreshtime = 1/60.0
+        self.marquee_interval   = 1/25.0 # Frame budget for scrolling track info
+        self.lastframe          = 0.0
+
+        # Frame counters: flips done, and seconds the display has been on.
+        # Frame slots of screen_refreshtime not drawn while on are skipped
+        self.frames = {"drawn" : 0, "on_time" : 0.0}
+        self.on_since = None
 
-        # Times in milliseconds
-        self.screen_refreshtime = 16.67
-        self.player_refreshtime = 200
+        # Activity during the current loop pass
+        self.active  = False
+        self.playing = False
+
+        self.scheduler.every("framestats", 60, self.log_frames)
+
+        # Time spent per loop phase. Dumped on SIGUSR1 and every stats_interval seconds
+        self.phases = PhaseStats(["read_mouse", "read_lirc", "pc.refresh", "sm.refresh", "sm.render", "display.update"])
+        self.phases_file = config.logpath + "/frame-stats.txt"
+        self.phases_dump = False
+        signal(SIGUSR1, self.request_stats_dump)
+        if getattr(config, "stats_interval", 0) > 0:
+            self.scheduler.every("phasestats", config.stats_interval, self.dump_stats)
 
         #Backlight
-        self.screen_timer = 0.0
         self.backlight = False
         self.update_screen_timeout(True)
         logger.debug("Setup done")
@@ -155,55 +191,149 @@ class PitftDaemon(Daemon):
     # Main loop
     def run(self):
         self.setup()
-        drawtime = datetime.datetime.now()
-        refreshtime = datetime.datetime.now()
 
         while 1:
-            updated = False
-            
-            # Check mouse and LIRC events
+            self.active = False
+
+            # Sleep until input or player data arrives or the next task is due
+            readable = []
             try:
-                active = self.read_mouse()
-                if self.lirc_enabled:
-                    active = active | self.read_lirc()
+                if self.touch_fd is None:
+                    # No way to wait for input: poll
+                    readable = self.wait_for_events(self.scheduler.timeout(self.input_polltime))
+                else:
+                    readable = self.wait_for_events(self.scheduler.timeout())
             except Exception as e:
                 logger.error(e)
 
-            try:
-                # Refresh info
-                if refreshtime < datetime.datetime.now():
-                    refreshtime = datetime.datetime.now() + timedelta(milliseconds=self.player_refreshtime)
-
-                    # Refresh information from players
-                    ret, updated = self.pc.refresh()
-                    active = active | ret
+            # New data published by the player pollers
+            if self.pc.fileno() in readable:
+                try:
+                    self.refresh_players()
+                except Exception as e:
+                    logger.error(e)
 
-                    # Update screen
-                    if updated:
-                        self.sm.refresh()
+            # Check mouse and LIRC events
+            try:
+                start = monotonic()
+                self.active = self.read_mouse() | self.active
+                self.phases.add("read_mouse", monotonic() - start)
+                if self.lirc_enabled:
+                    start = monotonic()
+                    self.active = self.read_lirc() | self.active
+                    self.phases.add("read_lirc", monotonic() - start)
             except Exception as e:
                 logger.error(e)
 
+            # Stats requested with SIGUSR1
+            if self.phases_dump:
+                self.phases_dump = False
+                self.dump_stats()
+
+            # Long press, smooth scrolling, frame, backlight
+            self.scheduler.run_pending()
+
             try:
                 # Update screen timeout, if there was any activity
                 if config.screen_timeout > 0:
-                    self.update_screen_timeout(active)
+                    self.update_screen_timeout(self.active | self.playing)
             except Exception as e:
                 logger.error(e)
 
+            # Scroll long track info while the display is on
+            if self.backlight and not self.scheduler.pending("marquee") and self.sm.marquee_running():
+                self.scheduler.schedule("marquee", 0.0, self.marquee)
+
+            # Request a frame if the screen needs redrawing. Don't draw when display is off
+            if self.backlight and self.sm.dirty() and not self.scheduler.pending("frame"):
+                delay = self.lastframe + self.screen_refreshtime - self.scheduler.clock()
+                self.scheduler.schedule("frame", max(delay, 0.0), self.draw)
+
+    def refresh_players(self):
+        # Refresh information from players
+        start = monotonic()
+        self.playing, updated = self.pc.refresh()
+        self.phases.add("pc.refresh", monotonic() - start)
+
+        # Update screen
+        if updated or self.sm.coverart_decoded():
+            start = monotonic()
+            self.sm.refresh()
+            self.phases.add("sm.refresh", monotonic() - start)
+
+    def marquee(self):
+        delay = self.sm.marquee_step()
+        if delay is not None and self.backlight:
+            self.scheduler.schedule("marquee", max(delay, self.marquee_interval), self.marquee)
+
+    def draw(self):
+        if not self.backlight:
+            return
+        self.lastframe = self.scheduler.clock()
+
+        # Update only the areas drawn
+        start = monotonic()
+        rects = self.sm.render(self.screen)
+        self.phases.add("sm.render", monotonic() - start)
+        if rects:
+            start = monotonic()
+            pygame.display.update(rects)
+            self.phases.add("display.update", monotonic() - start)
+            self.frames["drawn"] += 1
+
+    # Signal handler: only flag it, the main loop writes the file
+    def request_stats_dump(self, signum, frame):
+        self.phases_dump = True
+
+    def dump_stats(self):
+        try:
+            self.phases.dump(self.phases_file, "Frames drawn: %d, skipped: %d\nText cache: %s\nCover cache: %s\nCover fetcher: %s\nDownloads: %s\nCover decode: %s" %
+                             (self.frames["drawn"], self.skipped_frames(), text_cache.stats(),
+                              cover_cache.stats(), cover_fetcher.stats(), downloader.stats(), self.sm.decode_stats()))
+            logger.debug("Frame stats written to %s" % self.phases_file)
+        except Exception as e:
+            logger.error(e)
+
+    def log_frames(self):
+        logger.debug("Frames drawn: %d, skipped: %d" % (self.frames["drawn"], self.skipped_frames()))
+
+    """ Return value: frame slots the display was on without a frame drawn """
+    def skipped_frames(self):
+        on_time = self.frames["on_time"]
+        if self.on_since is not None:
+            on_time += self.scheduler.clock() - self.on_since
+        return max(int(on_time/self.screen_refreshtime) - self.frames["drawn"], 0)
+
+    # Block until touchscreen, LIRC or player input or timeout.
+    # Return value: readable file descriptors
+    def wait_for_events(self, timeout):
+        fds = [self.pc.fileno()]
+        if self.touch_fd is not None:
+            fds.append(self.touch_fd)
+        if self.lirc_enabled:
+            fds.append(self.lirc_sockid)
+
+        # Events already waiting in the SDL queue: only check the others
+        if pygame.event.peek():
+            timeout = 0
+
+        try:
+            readable = select.select(fds, [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+
+        # Drain the touchscreen handle, SDL reads its own copy of the events
+        if self.touch_fd in readable:
             try:
-                # Draw screen
-                if drawtime < datetime.datetime.now():
-                    drawtime = datetime.datetime.now() + timedelta(milliseconds=self.screen_refreshtime)
-
-                    # Don't draw when display is off
-                    if self.backlight:
-                        self.sm.render(self.screen)
-                        pygame.display.flip()
-                else:
-                    time.sleep(0.01)
-            except Exception as e:
-                logger.error(e)
+                while os.read(self.touch_fd, 4096):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+        return readable
 
     def read_mouse(self):
         direction = 0,0
@@ -211,13 +341,13 @@ class PitftDaemon(Daemon):
 
         for event in pygame.event.get():
             if event.type == pygame.MOUSEBUTTONDOWN:
-                self.clicktime = datetime.datetime.now()
                 # Filter out if instantly after previous mousebutton up event
-                if self.clicktime > self.click_filtertime:
+                if not self.scheduler.pending("clickfilter"):
                     self.pos = self.start_pos = pygame.mouse.get_pos()
                     userevents = True
                     if event.button == 1:
                         if self.smoothscroll:
+                            self.scheduler.cancel("smoothscroll")
                             self.scroll(self.start_pos, (0,0), True)
                             self.smoothscroll = False
                             self.smoothscroll_directions_index = 0
@@ -229,6 +359,7 @@ class PitftDaemon(Daemon):
                             self.mousebutton_down = False
                         else:
                             self.mousebutton_down = True
+                            self.scheduler.schedule("longpress", self.longpress_time, self.longpress)
 
                     # Scroll wheel
                     elif event.button == 4:
@@ -281,47 +412,51 @@ class PitftDaemon(Daemon):
                     else:
                         if self.smoothscroll:
                             self.scroll(self.start_pos, self.smoothscroll_direction)
-                            self.smoothscroll_time = datetime.datetime.now() + self.smoothscroll_timedelta
+                            self.scheduler.schedule("smoothscroll", self.smoothscroll_interval, self.smoothscroll_step)
                         else:
                             self.scroll(self.start_pos, (0,0), True)
                             self.mouse_scroll = ""
 
                 # Clear variables
                 self.mousebutton_down = False
+                self.scheduler.cancel("longpress")
 
                 # Filter next click, if it happens instantly
-                self.click_filtertime = datetime.datetime.now() + self.click_filterdelta
-
-        # Long press - register second click
-        if self.mousebutton_down and not self.mouse_scroll and not self.smoothscroll:
-            userevents = True
-            if datetime.datetime.now() - self.clicktime > self.longpress_time:
-                self.mousebutton_down = self.click(2, self.start_pos)
-
-                # Update timers
-                self.clicktime = datetime.datetime.now()
-
-        # No activity, but smooth scrolling
-        if self.smoothscroll and not self.mousebutton_down:
-            if datetime.datetime.now() > self.smoothscroll_time:
-                userevents = True
-                self.smoothscroll_direction = 0, int(self.smoothscroll_direction[1] * self.smoothscroll_factor)
-
-                # Decelerated under threshold -> Stop scrolling
-                if abs(self.smoothscroll_direction[1]) < self.scroll_threshold[1]:
-                    self.scroll(self.start_pos, (0,0), True)
-                    self.mouse_scroll = ""
-                    self.smoothscroll = False
-                    self.smoothscroll_directions_index = 0
-                    self.smoothscroll_directions = [0]*self.smoothscroll_direction_samples
-                    self.smoothscroll_direction = 0,0
-
-                else: # Continue scrolling
-                    self.scroll(self.start_pos, self.smoothscroll_direction)
-                    self.smoothscroll_time = datetime.datetime.now() + self.smoothscroll_timedelta
+                self.scheduler.schedule("clickfilter", self.click_filterdelta)
 
         return userevents
 
+    # Long press - register second click
+    def longpress(self):
+        if self.mousebutton_down and not self.mouse_scroll and not self.smoothscroll:
+            self.active = True
+            self.mousebutton_down = self.click(2, self.start_pos)
+
+            # Repeat while held
+            if self.mousebutton_down:
+                self.scheduler.schedule("longpress", self.longpress_time, self.longpress)
+
+    # No activity, but smooth scrolling
+    def smoothscroll_step(self):
+        if not self.smoothscroll or self.mousebutton_down:
+            return
+
+        self.active = True
+        self.smoothscroll_direction = 0, int(self.smoothscroll_direction[1] * self.smoothscroll_factor)
+
+        # Decelerated under threshold -> Stop scrolling
+        if abs(self.smoothscroll_direction[1]) < self.scroll_threshold[1]:
+            self.scroll(self.start_pos, (0,0), True)
+            self.mouse_scroll = ""
+            self.smoothscroll = False
+            self.smoothscroll_directions_index = 0
+            self.smoothscroll_directions = [0]*self.smoothscroll_direction_samples
+            self.smoothscroll_direction = 0,0
+
+        else: # Continue scrolling
+            self.scroll(self.start_pos, self.smoothscroll_direction)
+            self.scheduler.schedule("smoothscroll", self.smoothscroll_interval, self.smoothscroll_step)
+
     def click(self, mousebutton, clickpos):
         self.sm.click(mousebutton, clickpos)
 
@@ -351,13 +486,24 @@ class PitftDaemon(Daemon):
         subprocess.call("echo '" + str(state*1) + "' > " + config.backlight_sysfs, shell=True)
         self.backlight = state
 
+        # Time on, for the skipped frame count
+        if state and self.on_since is None:
+            self.on_since = self.scheduler.clock()
+        elif not state and self.on_since is not None:
+            self.frames["on_time"] += self.scheduler.clock() - self.on_since
+            self.on_since = None
+
     def update_screen_timeout(self, active):
         if active:
-            self.screen_timer = datetime.datetime.now() + timedelta(seconds=config.screen_timeout)
+            if config.screen_timeout > 0:
+                self.scheduler.schedule("backlight", config.screen_timeout, self.screen_off)
             if not self.backlight:
                 self.set_backlight(True)
-        elif self.screen_timer < datetime.datetime.now() and self.backlight:
+
+    def screen_off(self):
+        if self.backlight and not self.playing:
             self.set_backlight(False)
+            self.scheduler.cancel("marquee")
 
 if __name__ == "__main__":
     daemon = PitftDaemon('/tmp/pitft-playerui-daemon.pid')